@@ -0,0 +1,234 @@
+import argparse
+import copy
+import curses
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'src'))
+
+import pyniki.curses  # noqa: E402
+from pyniki.archive import FieldArchive, append_fields  # noqa: E402
+from pyniki.field import Field, load_field, save_field  # noqa: E402
+from pyniki.generate import generate, generate_fields  # noqa: E402
+from pyniki.sim import Simulator  # noqa: E402
+from pyniki.stepper import Stepper  # noqa: E402
+
+SIZES = [(5, 5), (10, 15), (20, 30), (40, 60), (1000, 1000)]
+
+PROGRAM = """
+for i in range(20000):
+    if vorne_frei():
+        vor()
+    else:
+        drehe_links()
+"""
+
+
+class NullScreen:
+    # stands in for the curses screen, so drawing can be measured without a terminal
+
+    def addstr(self, *args):
+        pass
+
+    def move(self, y, x):
+        pass
+
+    def clear(self):
+        pass
+
+    def noutrefresh(self):
+        pass
+
+    def refresh(self):
+        pass
+
+    def nodelay(self, flag):
+        pass
+
+    def getch(self):
+        return -1
+
+    def getmaxyx(self):
+        return 25, 80
+
+
+def measure(fn, min_time=0.2, repeat=5):
+    # best time per call in seconds
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    number = max(1, int(number * min_time / 0.2))
+    return min(timer.repeat(repeat, number)) / number
+
+
+def result(name, value, unit, **params):
+    return {'name': name, 'params': params, 'value': value, 'unit': unit}
+
+
+def bench_sim():
+    field = Field(10, 15, 1)
+
+    def primitives(sim):
+        start = time.perf_counter()
+        sim.run()
+        assert sim.error is None, sim.error
+        return (sim.steps + sim.sensor_calls) / (time.perf_counter() - start)
+
+    def null_screen():
+        sim = Simulator(PROGRAM, field, wait=lambda: sim.field.draw())
+        return sim
+
+    backends = {
+        'headless': lambda: Simulator(PROGRAM, field),
+        'headless-fast': lambda: Simulator(PROGRAM, field, fast=True),
+        'headless-stepper': lambda: Stepper(PROGRAM, field),
+        'null-screen': null_screen,
+    }
+    for backend, make in backends.items():
+        rate = max(primitives(make()) for _ in range(3))
+        yield result('sim.primitives', rate, 'primitives/s', backend=backend)
+
+
+def bench_draw():
+    for size_y, size_x in SIZES:
+        field = generate(0, size_y, size_x)
+        yield result('field.draw', measure(lambda: field.draw(full=True)), 's',
+                     size=f'{size_y}x{size_x}', kind='full')
+
+        def step():
+            field.direction = (field.direction + 1) % 4
+            field.draw()
+        yield result('field.draw', measure(step), 's', size=f'{size_y}x{size_x}', kind='incremental')
+
+
+def bench_field_io():
+    with tempfile.TemporaryDirectory() as tmp:
+        for size_y, size_x in SIZES:
+            field = generate(0, size_y, size_x)
+            path = os.path.join(tmp, 'F.rob')
+            size = f'{size_y}x{size_x}'
+            yield result('rob.save', 1 / measure(lambda: save_field(field, path)), 'fields/s', size=size)
+            yield result('rob.load', 1 / measure(lambda: load_field(path)), 'fields/s', size=size)
+
+        fields = list(generate_fields(1000, 0))
+        path = os.path.join(tmp, 'A.robs')
+        start = time.perf_counter()
+        append_fields(path, fields)
+        yield result('robs.append', len(fields) / (time.perf_counter() - start), 'fields/s', count=len(fields))
+        with FieldArchive(path) as archive:
+            yield result('robs.open', measure(lambda: FieldArchive(path).close()), 's', count=len(fields))
+            names = list(archive)
+            yield result('robs.load', len(names) / measure(lambda: [archive[n] for n in names], repeat=3),
+                         'fields/s', count=len(fields))
+
+
+def bench_copy():
+    for size_y, size_x in SIZES:
+        field = generate(0, size_y, size_x)
+        yield result('field.deepcopy', measure(lambda: copy.deepcopy(field)), 's', size=f'{size_y}x{size_x}')
+
+
+def bench_file_dialog():
+    from pyniki.main import FileDialog
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        for i in range(5000):
+            open(os.path.join(tmp, f'F{i:05}.{("py", "rob")[i % 2]}'), 'w').close()
+        os.chdir(tmp)
+        try:
+            yield result('file_dialog.first', measure(lambda: FileDialog(15, 'py'), repeat=3), 's', files=5000)
+            dialog = FileDialog(15, 'py')
+            yield result('file_dialog.set_extension',
+                         measure(lambda: (dialog.set_extension('rob'), dialog.set_extension('py'))) / 2, 's',
+                         files=5000)
+        finally:
+            os.chdir(cwd)
+
+
+def bench_startup():
+    import startup
+    runs = [startup.importtime('pyniki.main')['pyniki.main'][1] / 1e6 for _ in range(10)]
+    yield result('startup.import', sorted(runs)[len(runs) // 2], 's', module='pyniki.main')
+
+
+BENCHMARKS = {
+    'sim': bench_sim,
+    'draw': bench_draw,
+    'field_io': bench_field_io,
+    'copy': bench_copy,
+    'file_dialog': bench_file_dialog,
+    'startup': bench_startup,
+}
+
+
+def revision():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def key(r):
+    return r['name'], tuple(sorted(r['params'].items()))
+
+
+def compare(results, old):
+    old = {key(r): r['value'] for r in old['results']}
+    for r in results:
+        if key(r) not in old:
+            continue
+        ratio = r['value'] / old[key(r)]
+        # for rates higher is better, for times lower is better
+        better = ratio > 1 if r['unit'].endswith('/s') else ratio < 1
+        params = ' '.join(f'{k}={v}' for k, v in r['params'].items())
+        print(f'{r["name"]:26} {params:40} {ratio:6.2f}x {"better" if better else "worse"}', file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='pyniki benchmarks, results as JSON')
+    parser.add_argument('benchmarks', nargs='*', metavar='BENCHMARK',
+                        help=f'only these benchmarks ({", ".join(BENCHMARKS)})')
+    parser.add_argument('-o', '--output', default='-', help='JSON output file (default: stdout)')
+    parser.add_argument('--compare', metavar='JSON', help='print ratios to an earlier result file')
+    args = parser.parse_args()
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error(f'unknown benchmark {name}')
+
+    pyniki.curses._scr = NullScreen()
+    curses.doupdate = lambda: None
+
+    results = []
+    for name in args.benchmarks or BENCHMARKS:
+        for r in BENCHMARKS[name]():
+            print(f'{r["name"]:26} {" ".join(f"{k}={v}" for k, v in r["params"].items()):40} '
+                  f'{r["value"]:14.6g} {r["unit"]}', file=sys.stderr)
+            results.append(r)
+
+    data = {
+        'revision': revision(),
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+    }
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+    if args.output == '-':
+        json.dump(data, sys.stdout, indent=1)
+        print()
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(data, f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
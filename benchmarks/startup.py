@@ -0,0 +1,57 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'src')
+
+
+def python(*args):
+    env = dict(os.environ, PYTHONPATH=SRC)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)  # measure with compiled modules, as installed
+    return subprocess.run([sys.executable, *args], env=env, capture_output=True, text=True, check=True)
+
+
+def importtime(module):
+    # {module: (self, cumulative)} in microseconds from python -X importtime
+    times = {}
+    for line in python('-X', 'importtime', '-c', f'import {module}').stderr.splitlines()[1:]:
+        self_us, cumulative, name = line.split(':', 1)[1].split('|')
+        times[name.strip()] = (int(self_us), int(cumulative))
+    return times
+
+
+def wall_time(code):
+    start = time.perf_counter()
+    python('-c', code)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Startup time of the pyniki menu.')
+    parser.add_argument('-n', '--runs', type=int, default=20)
+    parser.add_argument('-m', '--module', default='pyniki.main')
+    parser.add_argument('--top', type=int, default=15, help='show the slowest imports')
+    args = parser.parse_args()
+
+    python('-c', f'import {args.module}')  # write the .pyc files
+    runs = [importtime(args.module) for _ in range(args.runs)]
+    cumulative = [r[args.module][1] / 1000 for r in runs]
+    interpreter = [wall_time('pass') for _ in range(args.runs)]
+    total = [wall_time(f'import {args.module}') for _ in range(args.runs)]
+
+    print(f'python {sys.version.split()[0]}, {args.runs} runs, medians')
+    print(f'import {args.module}: {statistics.median(cumulative):7.1f} ms')
+    print(f'interpreter alone:    {statistics.median(interpreter) * 1000:7.1f} ms')
+    print(f'interpreter + import: {statistics.median(total) * 1000:7.1f} ms')
+    print()
+    print(f'{"cumulative ms":>14}  module')
+    last = runs[-1]
+    for name, (_, c) in sorted(last.items(), key=lambda item: -item[1][1])[:args.top]:
+        print(f'{c / 1000:14.1f}  {name}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+import mmap
+import os
+import struct
+
+from pyniki.field import Field
+
+# A field archive is the file header followed by records of name length, data length,
+# name (utf-8) and the field in the .rob format. Records are only ever appended, a later
+# field with the same name replaces the earlier one.
+MAGIC = b'NIKA'
+VERSION = 1
+EXTENSION = '.robs'
+_HEADER = struct.Struct('<4sB3x')
+_RECORD = struct.Struct('<HI')
+
+
+class FieldArchive:
+
+    def __init__(self, path):
+        self.path = path
+        self.index = {}  # name -> (offset, length) of the field data
+        self._file = open(path, 'rb')
+        self._map = None
+        self._end = _HEADER.size
+        try:
+            magic, version = _HEADER.unpack(self._file.read(_HEADER.size))
+        except struct.error:
+            magic, version = None, None
+        if magic != MAGIC:
+            self.close()
+            raise ValueError('kein Feldarchiv')
+        if version > VERSION:
+            self.close()
+            raise ValueError(f'Feldarchiv Version {version} wird nicht unterstützt')
+        self.refresh()
+
+    def refresh(self):
+        # map the file again and index the records appended since the last call
+        size = os.fstat(self._file.fileno()).st_size
+        if self._map is not None and size == len(self._map):
+            return
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        data, i = self._map, self._end
+        while i + _RECORD.size <= size:
+            name_len, data_len = _RECORD.unpack_from(data, i)
+            start = i + _RECORD.size + name_len
+            if start + data_len > size:  # incomplete record of an interrupted append
+                break
+            self.index[data[i + _RECORD.size:start].decode()] = (start, data_len)
+            i = start + data_len
+        self._end = i
+
+    def data(self, name):
+        offset, length = self.index[name]
+        return memoryview(self._map)[offset:offset + length]
+
+    def __getitem__(self, name):
+        return Field.from_bytes(self.data(name), name=name)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+    def close(self):
+        # memoryviews returned by data() must be released before
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def append_fields(path, fields):
+    if os.path.exists(path):
+        with FieldArchive(path) as archive:
+            end = archive._end
+        f = open(path, 'r+b')
+        f.seek(end)
+        f.truncate()  # drop an incomplete record
+    else:
+        f = open(path, 'wb')
+        f.write(_HEADER.pack(MAGIC, VERSION))
+    with f:
+        records = []
+        for field in fields:
+            name, data = field.name.encode(), field.to_bytes()
+            records += (_RECORD.pack(len(name), len(data)), name, data)
+            if len(records) >= 3000:
+                f.write(b''.join(records))
+                records = []
+        f.write(b''.join(records))
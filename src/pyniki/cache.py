@@ -0,0 +1,70 @@
+import hashlib
+import marshal
+import os
+import sys
+from collections import OrderedDict
+
+from pyniki.compiler import VERSION, compile_fast, compile_stepper
+
+_compilers = {
+    'exec': lambda program: compile(program, 'None', 'exec'),
+    'fast': compile_fast,
+    'step': compile_stepper,
+}
+
+
+class CodeCache:
+
+    def __init__(self, maxsize=256, path=None):
+        self.maxsize = maxsize
+        self.path = path
+        self._codes = OrderedDict()
+
+    def compile(self, program, mode='exec'):
+        key = hashlib.sha256(program.encode()).hexdigest()
+        if mode != 'exec':
+            key = f'{key}-{mode}'
+        code = self._codes.get(key)
+        if code is not None:
+            self._codes.move_to_end(key)
+            return code
+        code = self._load(key)
+        if code is None:
+            code = _compilers[mode](program)
+            self._store(key, code)
+        self._codes[key] = code
+        if len(self._codes) > self.maxsize:
+            self._codes.popitem(last=False)
+        return code
+
+    def clear(self):
+        self._codes.clear()
+
+    def _filename(self, key):
+        # marshalled code objects are only valid for the interpreter and compiler that wrote them
+        return os.path.join(self.path, f'{key}.{sys.implementation.cache_tag}-{VERSION}')
+
+    def _load(self, key):
+        if self.path is None:
+            return None
+        try:
+            with open(self._filename(key), 'rb') as f:
+                return marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+
+    def _store(self, key, code):
+        if self.path is None:
+            return
+        filename = self._filename(key)
+        tmp = f'{filename}.{os.getpid()}.tmp'
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            with open(tmp, 'wb') as f:
+                marshal.dump(code, f)
+            os.replace(tmp, filename)
+        except OSError:
+            pass
+
+
+code_cache = CodeCache()
@@ -0,0 +1,102 @@
+import base64
+import collections
+import json
+import os
+import socket
+
+# socket of `pyniki serve` if none is given
+SOCKET = os.path.join(os.path.expanduser('~'), 'pyniki', 'serve.sock')
+
+
+class ServerError(Exception):
+    pass
+
+
+class Client:
+    # Connection to a `pyniki serve` daemon. A field is a pyniki Field or a reference the server
+    # resolves itself, "feld.rob" or "archiv.robs:NAME". Limits are the options of grade():
+    # max_steps, max_sensors, max_time, fast and stats.
+
+    def __init__(self, path=SOCKET):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self.file = self.sock.makefile('rb')
+        self.next_id = 0
+        self.pending = 0
+        self.received = collections.deque()  # results that arrived while waiting for something else
+
+    def _send(self, message):
+        self.sock.sendall(json.dumps(message).encode() + b'\n')
+
+    def _receive(self):
+        line = self.file.readline()
+        if not line:
+            raise ServerError('Verbindung zum Server beendet')
+        return json.loads(line)
+
+    def submit(self, program, field, **limits):
+        # sends a job without waiting for its result, returns the id of the result
+        job_id = self.next_id
+        self.next_id += 1
+        message = {'id': job_id, 'program': program, 'limits': limits}
+        if isinstance(field, str):
+            message['field'] = field
+        else:
+            message['field_data'] = base64.b64encode(field.to_bytes()).decode()
+        self._send(message)
+        self.pending += 1
+        return job_id
+
+    def result(self):
+        # next result of a submitted job, in the order the runs finish
+        if self.received:
+            return self.received.popleft()
+        while True:
+            message = self._receive()
+            if 'status' not in message:
+                self.pending -= 1
+                return message
+
+    def grade(self, jobs, window=32):
+        # jobs: (program, field, limits), yields the results in order; at most window jobs are
+        # sent ahead, so the server is never waiting for us to read while we wait for it
+        jobs = iter(jobs)
+        first = self.next_id
+        results = {}
+        done = first
+        more = True
+        while True:
+            while more and self.pending < window:
+                try:
+                    program, field, limits = next(jobs)
+                except StopIteration:
+                    more = False
+                    break
+                self.submit(program, field, **limits)
+            if done == self.next_id:
+                return
+            while done not in results:
+                result = self.result()
+                results[result['id']] = result
+            yield results.pop(done)
+            done += 1
+
+    def status(self):
+        # queue depth and counters of the server
+        self._send({'status': True})
+        while True:
+            message = self._receive()
+            if 'status' in message:
+                return message['status']
+            self.pending -= 1
+            self.received.append(message)
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,278 @@
+import ast
+import copy
+import symtable
+
+# part of the on-disk cache keys, increase it whenever compile_fast or compile_stepper change the
+# code they generate
+VERSION = 3
+
+# Fast mode keeps the robot state in globals of the program namespace and inlines the
+# primitives as code working on them:
+#   _niki_p      flat index y*size_x + x of Niki's cell
+#   _niki_d      direction
+#   _niki_v      vorrat
+#   _niki_discs  Field.discs,  _niki_free  Field.free,  _niki_delta  index offset per direction
+#   _niki_steps, _niki_sensors, _niki_step_check, _niki_sensor_check, _niki_check
+#                counters, thresholds and slow path of the Simulator limits
+#   _niki_error  NikiError
+STATE = ('_niki_p', '_niki_d', '_niki_v', '_niki_steps', '_niki_sensors')
+
+_ACTIONS = {
+    'vor': """
+if not _niki_free[_niki_p] >> _niki_d & 1:
+    raise _niki_error
+_niki_p += _niki_delta[_niki_d]
+""",
+    'drehe_links': """
+_niki_d = (_niki_d + 1) & 3
+""",
+    'nimm_auf': """
+if _niki_discs[_niki_p] == 0 or _niki_v == 99:
+    raise _niki_error
+_niki_discs[_niki_p] -= 1
+_niki_v += 1
+""",
+    'gib_ab': """
+if _niki_v == 0 or _niki_discs[_niki_p] == 9:
+    raise _niki_error
+_niki_discs[_niki_p] += 1
+_niki_v -= 1
+""",
+}
+
+_SENSORS = {
+    'vorne_frei': '_niki_free[_niki_p] >> _niki_d & 1 == 1',
+    'links_frei': '_niki_free[_niki_p] >> ((_niki_d + 1) & 3) & 1 == 1',
+    'rechts_frei': '_niki_free[_niki_p] >> ((_niki_d + 3) & 3) & 1 == 1',
+    'hat_vorrat': '_niki_v > 0',
+    'platz_belegt': '_niki_discs[_niki_p] > 0',
+}
+
+
+def _action_source(name):
+    return f"""
+if _niki_steps >= _niki_step_check:
+    _niki_check()
+{_ACTIONS[name].strip()}
+_niki_steps += 1
+"""
+
+
+def _sensor_source(name):
+    expr = _SENSORS[name]
+    return (f'({expr}) if (_niki_sensors := _niki_sensors + 1) <= _niki_sensor_check '
+            f'else (_niki_check(), {expr})[1]')
+
+
+def _prelude_source():
+    # plain functions for calls that are not inlined, working on the same state
+    src = []
+    for name in _ACTIONS:
+        body = _action_source(name).strip().replace('\n', '\n    ')
+        src.append(f'def {name}():\n    global {", ".join(STATE)}\n    {body}\n')
+    for name in _SENSORS:
+        src.append(f'def {name}():\n    global {", ".join(STATE)}\n    return {_sensor_source(name)}\n')
+    return '\n'.join(src)
+
+
+_action_templates = {name: ast.parse(_action_source(name)).body for name in _ACTIONS}
+_sensor_templates = {name: ast.parse(_sensor_source(name), mode='eval').body for name in _SENSORS}
+# executed in the program namespace before the program itself
+prelude = compile(_prelude_source(), '<pyniki>', 'exec')
+
+
+def _bound_names(tree):
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and not isinstance(node.ctx, ast.Load):
+            names.add(node.id)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.add(node.name)
+        elif isinstance(node, ast.arg):
+            names.add(node.arg)
+        elif isinstance(node, ast.alias):
+            names.add((node.asname or node.name).split('.')[0])
+        elif isinstance(node, (ast.Global, ast.Nonlocal)):
+            names.update(node.names)
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            names.add(node.name)
+    return names
+
+
+def _located(nodes, location):
+    nodes = copy.deepcopy(nodes)
+    for node in nodes if isinstance(nodes, list) else [nodes]:
+        for n in ast.walk(node):
+            ast.copy_location(n, location)
+    return nodes
+
+
+class _Inliner(ast.NodeTransformer):
+
+    def __init__(self, inline):
+        self.inline = inline
+
+    def _primitive(self, node):
+        if (isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and not node.args
+                and not node.keywords and node.func.id in self.inline):
+            return node.func.id
+        return None
+
+    def visit_Expr(self, node):
+        name = self._primitive(node.value)
+        if name in _action_templates:
+            return _located(_action_templates[name], node)
+        return self.generic_visit(node)
+
+    def visit_Call(self, node):
+        name = self._primitive(node)
+        if name in _sensor_templates:
+            return _located(_sensor_templates[name], node)
+        return self.generic_visit(node)
+
+    def visit_FunctionDef(self, node):
+        self.generic_visit(node)
+        node.body.insert(0, _located(ast.Global(names=list(STATE)), node.body[0]))
+        return node
+
+    visit_AsyncFunctionDef = visit_FunctionDef  # noqa: N815 (ast.NodeVisitor method name)
+
+    # no global declarations possible in these scopes, leave calls to the prelude functions
+    def visit_Lambda(self, node):
+        return node
+
+    def visit_ClassDef(self, node):
+        return node
+
+    visit_ListComp = visit_SetComp = visit_DictComp = visit_GeneratorExp = visit_Lambda  # noqa: N815
+
+
+def compile_fast(program, filename='None'):
+    tree = ast.parse(program, filename)
+    inline = (set(_ACTIONS) | set(_SENSORS)) - _bound_names(tree)
+    tree = _Inliner(inline).visit(tree)
+    ast.fix_missing_locations(tree)
+    return compile(tree, filename, 'exec')
+
+
+# Stepper mode turns the module body and every plain function of the program into generators
+# and wraps every call as `(yield from _niki_call(f, ...))`. _niki_call yields once for each
+# primitive action (which return the marker STEP in that mode) and delegates to the generators
+# of transformed functions, so the whole program can be suspended after every action. Where a
+# yield is not possible (lambdas, comprehensions, classes, generators of the program itself)
+# calls are wrapped as `_niki_run(f(...))`. Transformed functions are decorated with
+# _niki_function, which makes them plain functions again that run to completion when called
+# that way or by Python itself (map, sorted, decorators). `from ... import *` is not allowed
+# in _niki_main and becomes a call of _niki_import, `from __future__ import ...` and the
+# docstring stay in front of it.
+
+
+def _contains_yield(node):
+    stack = list(node.body)
+    while stack:
+        n = stack.pop()
+        if isinstance(n, (ast.Yield, ast.YieldFrom)):
+            return True
+        if not isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Lambda)):
+            stack.extend(ast.iter_child_nodes(n))
+    return False
+
+
+class _Stepper(ast.NodeTransformer):
+
+    def __init__(self):
+        self.yieldable = True
+
+    def _visit_in(self, yieldable, nodes):
+        old, self.yieldable = self.yieldable, yieldable
+        try:
+            return [self.visit(n) for n in nodes]
+        finally:
+            self.yieldable = old
+
+    def _visit_body(self, yieldable, body):
+        result = []
+        for n in self._visit_in(yieldable, body):
+            result.extend(n if isinstance(n, list) else [n])
+        return result
+
+    def visit_Call(self, node):
+        self.generic_visit(node)
+        if self.yieldable:
+            call = ast.Call(func=ast.Name(id='_niki_call', ctx=ast.Load()), args=[node.func] + node.args,
+                            keywords=node.keywords)
+            return ast.copy_location(ast.YieldFrom(value=ast.copy_location(call, node)), node)
+        call = ast.Call(func=ast.Name(id='_niki_run', ctx=ast.Load()), args=[node], keywords=[])
+        return ast.copy_location(call, node)
+
+    def visit_FunctionDef(self, node):
+        node.decorator_list = self._visit_in(self.yieldable, node.decorator_list)
+        node.args = self._visit_in(self.yieldable, [node.args])[0]
+        if node.returns is not None:
+            node.returns = self._visit_in(self.yieldable, [node.returns])[0]
+        if _contains_yield(node):
+            node.body = self._visit_body(False, node.body)
+            return node
+        node.body = self._visit_body(True, node.body)
+        node.body.extend(_located(ast.parse('if False:\n    yield').body, node.body[-1]))
+        node.decorator_list.append(_located(ast.Name(id='_niki_function', ctx=ast.Load()), node))
+        return node
+
+    def visit_AsyncFunctionDef(self, node):
+        return self._generic_in(False, node)
+
+    def visit_ClassDef(self, node):
+        node.decorator_list = self._visit_in(self.yieldable, node.decorator_list)
+        node.bases = self._visit_in(self.yieldable, node.bases)
+        node.keywords = self._visit_in(self.yieldable, node.keywords)
+        old, self.yieldable = self.yieldable, False
+        try:
+            # methods stay plain functions, __init__ and friends must not turn into generators
+            node.body = [self._generic_in(False, n) if isinstance(n, ast.FunctionDef) else self.visit(n)
+                         for n in node.body]
+        finally:
+            self.yieldable = old
+        return node
+
+    def _generic_in(self, yieldable, node):
+        old, self.yieldable = self.yieldable, yieldable
+        try:
+            return self.generic_visit(node)
+        finally:
+            self.yieldable = old
+
+    def visit_Lambda(self, node):
+        return self._generic_in(False, node)
+
+    visit_ListComp = visit_SetComp = visit_DictComp = visit_GeneratorExp = visit_Lambda  # noqa: N815
+
+    def visit_ImportFrom(self, node):
+        if node.names[0].name != '*':
+            return node
+        statement = f'from {"." * node.level}{node.module or ""} import *'
+        return _located(ast.parse(f'_niki_import({statement!r})').body[0], node)
+
+
+def _module_head(body):
+    n = 0
+    if body and isinstance(body[0], ast.Expr) and isinstance(body[0].value, ast.Constant) \
+            and isinstance(body[0].value.value, str):
+        n = 1
+    while n < len(body) and isinstance(body[n], ast.ImportFrom) and body[n].module == '__future__':
+        n += 1
+    return n
+
+
+def compile_stepper(program, filename='None'):
+    names = sorted(symtable.symtable(program, filename, 'exec').get_identifiers())
+    tree = ast.parse(program, filename)
+    n = _module_head(tree.body)
+    head, tree.body = tree.body[:n], tree.body[n:]
+    body = _Stepper().visit(tree).body
+    main = ast.parse('def _niki_main():\n    if False:\n        yield').body[0]
+    if names:
+        main.body.insert(0, ast.Global(names=names))
+    main.body[-1:-1] = body
+    tree.body = head + [main]
+    ast.fix_missing_locations(tree)
+    return compile(tree, filename, 'exec')
@@ -0,0 +1,197 @@
+import bisect
+from array import array
+
+from pyniki.trace import apply, wrap
+
+# file name the Simulator compiles programs with, identifies the frames of the program
+FILENAME = 'None'
+
+
+def program_line(frame):
+    # line of the innermost program frame at or above frame
+    while frame is not None and frame.f_code.co_filename != FILENAME:
+        frame = frame.f_back
+    return frame.f_lineno if frame is not None else 0
+
+
+# sensor answers kept between two steps, a program that only asks the sensors runs without bound
+MAX_ANSWERS = 100
+
+
+class Recorder:
+    # Records action and program line of the steps first+1 .. last and the sensor answers leading
+    # to them, with a field copy every checkpoint_interval steps. If last is None, only the most
+    # recent window to 2*window steps are kept, so memory stays bounded for any number of steps.
+    # Is passed to the Simulator as its trace.
+
+    def __init__(self, first=0, last=None, window=100000, checkpoint_interval=1000):
+        self.first, self.last = first, last
+        self.window, self.checkpoint_interval = window, checkpoint_interval
+        self.field = None
+        self.steps = 0
+        self.error = False
+        self.error_line = None
+        self.events = bytearray()
+        self.lines = array('I')
+        self.answers = bytearray()  # sensor events after step first
+        self.answer_ends = array('I')  # len(answers) at each recorded step
+        self.first_line = None
+        self.checkpoints = []  # (step, field copy)
+        self.checkpoint_steps = []
+
+    @property
+    def end(self):
+        return self.first + len(self.events)
+
+    def start(self, field):
+        self.field = field
+        if self.first == 0:
+            self._checkpoint()
+
+    def _checkpoint(self):
+        self.checkpoints.append((self.steps, self.field.copy()))
+        self.checkpoint_steps.append(self.steps)
+
+    def record(self, event, line):
+        self.steps += 1
+        if self.steps == self.first:
+            self.first_line = line
+            self._checkpoint()
+        elif self.steps > self.first and (self.last is None or self.steps <= self.last):
+            self.events.append(event)
+            self.lines.append(line)
+            self.answer_ends.append(len(self.answers))
+            if self.steps % self.checkpoint_interval == 0:
+                self._checkpoint()
+            if self.last is None and len(self.events) >= 2 * self.window:
+                self._drop_oldest()
+
+    def sense(self, event):
+        if self.first <= self.steps and (self.last is None or self.steps <= self.last):
+            if len(self.answers) - (self.answer_ends[-1] if self.answer_ends else 0) < MAX_ANSWERS:
+                self.answers.append(event)
+
+    def _drop_oldest(self):
+        i = bisect.bisect_right(self.checkpoint_steps, self.end - self.window) - 1
+        first = self.checkpoint_steps[i]
+        n = first - self.first
+        if n == 0:
+            return
+        self.first_line = self.lines[n - 1]
+        dropped = self.answer_ends[n - 1]
+        del self.answers[:dropped]
+        self.answer_ends = array('I', (end - dropped for end in self.answer_ends[n:]))
+        del self.events[:n]
+        del self.lines[:n]
+        del self.checkpoints[:i]
+        del self.checkpoint_steps[:i]
+        self.first = first
+
+    def line(self, frame):
+        # steps in front of the recorded ones need no line
+        return program_line(frame) if self.steps >= self.first - 1 else 0
+
+    def wrap(self, namespace):
+        return wrap(namespace, self)
+
+    def checkpoint(self, step):
+        return self.checkpoints[bisect.bisect_right(self.checkpoint_steps, step) - 1]
+
+
+class Debugger:
+    # Moves through the steps of a recorded run. Steps outside the recording are reached by
+    # running the program again without screen, recording window steps around the target.
+
+    def __init__(self, program, field, recorder, error_line=None, simulator=None):
+        self.program = program
+        self.simulator = simulator  # runs the program again, Simulator if None
+        self.start_field = field
+        self.recorder = recorder
+        self.steps = recorder.steps
+        self.error = recorder.error
+        self.error_line = error_line if error_line is not None else recorder.error_line
+        self.program_lines = program.splitlines()
+        self.step = None
+        self.seek(0)
+
+    @property
+    def line(self):
+        # program line of the last step, or of the failing call at the end of a failed run
+        if self.error and self.step == self.steps:
+            return self.error_line
+        recorder = self.recorder
+        if self.step > recorder.first:
+            return recorder.lines[self.step - recorder.first - 1]
+        return recorder.first_line
+
+    @property
+    def answers(self):
+        # sensor answers since the previous step, at the end of the run also those after the last
+        # step
+        recorder = self.recorder
+        i = self.step - recorder.first
+        start = recorder.answer_ends[i - 2] if i > 1 else 0
+        end = len(recorder.answers) if self.step == self.steps else recorder.answer_ends[i - 1] if i > 0 else 0
+        return recorder.answers[start:end]
+
+    def source(self, line):
+        if line is None or not 0 < line <= len(self.program_lines):
+            return ''
+        return self.program_lines[line - 1].strip()
+
+    def _resimulate(self, step):
+        run_with = self.simulator
+        if run_with is None:
+            from pyniki.sim import Simulator
+            run_with = Simulator
+        recorder = self.recorder
+        first = max(0, step - recorder.window // 2)
+        first -= first % recorder.checkpoint_interval
+        last = min(first + recorder.window, self.steps)
+        recorder = Recorder(first, last, recorder.window, recorder.checkpoint_interval)
+        run_with(self.program, self.start_field, max_steps=last, trace=recorder).run()
+        self.recorder = recorder
+
+    def _restore(self, checkpoint):
+        self.step, field = checkpoint
+        self.field = field.copy()
+
+    def _update_zustand(self):
+        self.field.zustand = not (self.error and self.step == self.steps)
+
+    def forward(self):
+        if self.step >= self.steps:
+            return False
+        if self.step >= self.recorder.end:
+            self.seek(self.step + 1)
+            return True
+        apply(self.field, self.recorder.events[self.step - self.recorder.first])
+        self.step += 1
+        self._update_zustand()
+        return True
+
+    def backward(self):
+        if self.step <= 0:
+            return False
+        if self.step <= self.recorder.first:
+            self.seek(self.step - 1)
+            return True
+        self.step -= 1
+        apply(self.field, self.recorder.events[self.step - self.recorder.first], backwards=True)
+        self._update_zustand()
+        return True
+
+    def seek(self, step):
+        step = max(0, min(step, self.steps))
+        if not self.recorder.first <= step <= self.recorder.end:
+            self._resimulate(step)
+            self.step = None
+            step = min(step, self.recorder.end)  # in case the program does not repeat its run
+        checkpoint = self.recorder.checkpoint(step)
+        if self.step is None or not checkpoint[0] <= self.step <= step:
+            self._restore(checkpoint)
+        events, first = self.recorder.events, self.recorder.first
+        while self.step < step:
+            apply(self.field, events[self.step - first])
+            self.step += 1
+        self._update_zustand()
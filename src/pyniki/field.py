@@ -1,143 +1,465 @@
 import curses
+import os
+import struct
 
 from pyniki.curses import scr
 from pyniki.ui import print_first_line
 
 
+def _bits(n):
+    return bytearray((n + 7) // 8)
+
+
+def _get_bit(bits, i):
+    return bits[i >> 3] >> (i & 7) & 1 == 1
+
+
+def _set_bit(bits, i, val):
+    if val:
+        bits[i >> 3] |= 1 << (i & 7)
+    else:
+        bits[i >> 3] &= ~(1 << (i & 7))
+
+
+_FREE = bytes(~m & 15 for m in range(256))
+_DIRECTION_FREE = [bytes(m >> d & 1 for m in range(256)) for d in range(4)]
+_UNPACK = [bytes(b >> i & 1 for i in range(8)) for b in range(256)]
+
+
+def _unpack(bits, n):
+    # one byte 0/1 per bit
+    return b''.join(map(_UNPACK.__getitem__, bits))[:n]
+
+
+_PACK = {flags: b for b, flags in enumerate(_UNPACK)}
+
+
+def _pack(flags):
+    flags = bytes(flags) + bytes(-len(flags) % 8)
+    return bytearray(_PACK[flags[i:i+8]] for i in range(0, len(flags), 8))
+
+
+def _masks(n, *flags):
+    # byte i of the result has bit k set if flags[k][i] is 1, computed on whole arrays at once
+    mask = 0
+    for k, f in enumerate(flags):
+        mask |= int.from_bytes(f, 'big') << k
+    return bytearray(mask.to_bytes(n, 'big'))
+
+
+def _junction_glyph(l, r, u, o):
+    if r:
+        if o:
+            if u:
+                c = '┼' if l else '├'
+            else:
+                c = '┴' if l else '└'
+        else:
+            if u:
+                c = '┬' if l else '┌'
+            else:
+                c = '─' if l else ' '
+    else:
+        if o:
+            if u:
+                c = '┤' if l else '│'
+            else:
+                c = '┘' if l else ' '
+        else:
+            if u:
+                c = '┐' if l else ' '
+            else:
+                c = ' '
+    return c
+
+
+# field file: header, discs, v_walls, h_walls; all sizes follow from the header
+MAGIC = b'NIKI'
+VERSION = 1
+_HEADER = struct.Struct('<4sBxHHHHBB')
+
+
+def _load_legacy(data):
+    # .rob files used to be pickled Field objects, never load anything else from them
+    import io
+    import pickle
+
+    class Unpickler(pickle.Unpickler):
+        def find_class(self, module, name):
+            if (module, name) in (('pyniki.field', 'Field'), ('builtins', 'bytearray')):
+                return super().find_class(module, name)
+            raise pickle.UnpicklingError(f'{module}.{name} in Felddatei nicht erlaubt')
+
+    return Unpickler(io.BytesIO(data)).load()
+
+
+# largest part of a field shown at once, as many cells as fit the 80x25 screen next to the panel
+VIEW_SIZE_Y, VIEW_SIZE_X = 10, 15
+
+# box-drawing glyph of a grid vertex, indexed by its mask l | r << 1 | u << 2 | o << 3
+_JUNCTIONS = [_junction_glyph(m & 1, m & 2, m & 4, m & 8) for m in range(16)]
+
+
 class Field:
 
+    _state = ('size_y', 'size_x', 'offset_y', 'offset_x', 'discs', 'v_walls', 'h_walls',
+              'x0', 'y0', 'panel_x', 'panel_y', 'nx', 'ny', '_direction', 'vorrat', 'zustand', 'name')
+    # visible part of the field: rows x cols cells from (view_y, view_x); follow keeps Niki in it
+    _view = ('rows', 'cols', 'view_y', 'view_x', 'follow')
+    __slots__ = _state + _view + ('free', 'junctions', 'stats', '_shared', '_dirty', '_full', '_panel')
+
     def __init__(self, size_y, size_x, offset_y=0, offset_x=0, name=''):
         self.size_y, self.size_x, self.offset_y, self.offset_x = \
             size_y, size_x, offset_y, offset_x
 
-        self.discs = [[0 for _ in range(size_x)] for _ in range(size_y)]
-
-        self.v_walls = [[False for _ in range(size_x + 1)] for _ in range(size_y)]
-        self.h_walls = [[False for _ in range(size_x)] for _ in range(size_y + 1)]
-        for x in range(size_x):
-            self.h_walls[0][x] = True
-            self.h_walls[-1][x] = True
-        for y in range(size_y):
-            self.v_walls[y][0] = True
-            self.v_walls[y][-1] = True
-
-        self.x0 = offset_x + 6
-        self.y0 = offset_y + (size_y-1) * 2 + 1
-        self.panel_x = self.screen_x(self.size_x-1) + 3 + 4
-        self.panel_y = self.screen_y(self.size_y-1)
+        # discs[y*size_x + x], h_walls bit y*size_x + x, v_walls bit y*(size_x+1) + x
+        self.discs = bytearray(size_y * size_x)
+        self.v_walls = _pack((b'\1' + bytes(size_x - 1) + b'\1') * size_y)
+        self.h_walls = _pack(b'\1' * size_x + bytes((size_y - 1) * size_x) + b'\1' * size_x)
+
+        self._init_layout()
         self.nx = 0
         self.ny = 0
         self._direction = 0
         self.vorrat = 0
         self.zustand = None
         self.name = name
+        self._init_masks()
+        self.stats = None
+        self._reset_damage()
+
+    def _init_layout(self):
+        # row numbers of more than two digits take room from the leftmost column
+        extra = max(0, len(str(self.size_y)) - 2)
+        self.rows = min(self.size_y, VIEW_SIZE_Y)
+        self.cols = min(self.size_x, VIEW_SIZE_X - (extra > 0))
+        self.view_y = self.view_x = 0
+        self.follow = True
+        self.x0 = self.offset_x + 6 + extra
+        self.y0 = self.offset_y + (self.rows-1) * 2 + 1
+        self.panel_x = self.screen_x(self.cols-1) + 3 + 4
+        self.panel_y = self.screen_y(self.rows-1)
+
+    def to_bytes(self):
+        return b''.join((_HEADER.pack(MAGIC, VERSION, self.size_y, self.size_x, self.ny, self.nx,
+                                      self._direction, self.vorrat),
+                         self.discs, self.v_walls, self.h_walls))
+
+    @classmethod
+    def from_bytes(cls, data, offset_y=1, offset_x=0, name=''):
+        if data[:4] != MAGIC:
+            if data[:1] == b'\x80':
+                field = _load_legacy(data)
+                if not isinstance(field, Field):
+                    raise ValueError('keine Felddatei')
+                field.name = name
+                return field
+            raise ValueError('keine Felddatei')
+        if len(data) < _HEADER.size:
+            raise ValueError('Felddatei ist beschädigt')
+        magic, version, size_y, size_x, ny, nx, direction, vorrat = _HEADER.unpack_from(data)
+        if version > VERSION:
+            raise ValueError(f'Felddatei Version {version} wird nicht unterstützt')
+        n_discs = size_y * size_x
+        n_v = (size_y * (size_x + 1) + 7) // 8
+        n_h = ((size_y + 1) * size_x + 7) // 8
+        i = _HEADER.size
+        if (len(data) != i + n_discs + n_v + n_h or size_y == 0 or size_x == 0
+                or not (ny < size_y and nx < size_x and direction < 4 and vorrat <= 99)
+                or max(data[i:i + n_discs]) > 9):
+            raise ValueError('Felddatei ist beschädigt')
+        field = cls.__new__(cls)
+        field.size_y, field.size_x, field.offset_y, field.offset_x = size_y, size_x, offset_y, offset_x
+        field.discs = bytearray(data[i:i + n_discs])
+        i += n_discs
+        field.v_walls = bytearray(data[i:i + n_v])
+        field.h_walls = bytearray(data[i + n_v:])
+        field._init_layout()
+        field.ny, field.nx, field._direction, field.vorrat = ny, nx, direction, vorrat
+        field.zustand = None
+        field.name = name
+        field._init_masks()
+        # Niki must never be able to leave the field, whatever the file says
+        free = field.free
+        if 1 in b''.join((free[size_x-1::size_x].translate(_DIRECTION_FREE[0]),
+                          free[-size_x:].translate(_DIRECTION_FREE[1]),
+                          free[::size_x].translate(_DIRECTION_FREE[2]),
+                          free[:size_x].translate(_DIRECTION_FREE[3]))):
+            raise ValueError('Felddatei ist beschädigt')
+        field.stats = None
+        field._reset_damage()
+        return field
+
+    def __getstate__(self):
+        return {k: getattr(self, k) for k in self._state}
+
+    def __setstate__(self, state):
+        if isinstance(state['discs'], list):  # pickled list-based Field from pyNIKI <= 0.0.6
+            state = dict(state)
+            size_y, size_x = state['size_y'], state['size_x']
+            state['discs'] = bytearray(d for row in state['discs'] for d in row)
+            for k, n in (('v_walls', size_y * (size_x + 1)), ('h_walls', (size_y + 1) * size_x)):
+                bits = _bits(n)
+                for i, w in enumerate(w for row in state[k] for w in row):
+                    _set_bit(bits, i, w)
+                state[k] = bits
+        for k in self._state:
+            setattr(self, k, state[k])
+        self._init_layout()
+        self._init_masks()
+        self.stats = None
+        self._reset_damage()
+
+    def copy(self):
+        field = Field.__new__(Field)
+        for k in self._state + self._view:
+            setattr(field, k, getattr(self, k))
+        field.discs = self.discs[:]
+        # walls and the masks derived from them are shared until one of the fields changes a wall
+        field.free = self.free
+        field.junctions = self.junctions
+        self._shared = field._shared = True
+        field.stats = None
+        field._reset_damage()
+        return field
+
+    def __copy__(self):
+        return self.copy()
+
+    def __deepcopy__(self, memo):
+        return self.copy()
+
+    def _unshare(self):
+        self.v_walls = self.v_walls[:]
+        self.h_walls = self.h_walls[:]
+        self.free = self.free[:]
+        self.junctions = self.junctions[:]
+        self._shared = False
+
+    def _init_masks(self):
+        self._shared = False
+        sy, sx = self.size_y, self.size_x
+        v = _unpack(self.v_walls, sy * (sx+1))
+        h = _unpack(self.h_walls, (sy+1) * sx)
+        # free[y*size_x + x] has bit d set if Niki can move in direction d from (y, x)
+        east, west = bytearray(v), bytearray(v)
+        del east[::sx+1]
+        del west[sx::sx+1]
+        self.free = _masks(sy * sx, east, h[sx:], west, h[:sy*sx]).translate(_FREE)
+        # junctions[y*(size_x+1) + x] is the wall mask of the grid vertex below and left of (y, x)
+        none = bytes(sx + 1)
+        self.junctions = _masks((sy+1) * (sx+1),
+                                b''.join(b'\0' + h[y*sx:(y+1)*sx] for y in range(sy + 1)),
+                                b''.join(h[y*sx:(y+1)*sx] + b'\0' for y in range(sy + 1)),
+                                none + v,
+                                v + none)
+
+    def _update_free(self, y, x):
+        if 0 <= y < self.size_y and 0 <= x < self.size_x:
+            self.free[y*self.size_x + x] = (
+                (not self.get_v_wall(y, x+1))
+                | (not self.get_h_wall(y+1, x)) << 1
+                | (not self.get_v_wall(y, x)) << 2
+                | (not self.get_h_wall(y, x)) << 3
+            )
+
+    def _update_junction(self, y, x):
+        self.junctions[y*(self.size_x+1) + x] = (
+            (x > 0 and self.get_h_wall(y, x-1))
+            | (x < self.size_x and self.get_h_wall(y, x)) << 1
+            | (y > 0 and self.get_v_wall(y-1, x)) << 2
+            | (y < self.size_y and self.get_v_wall(y, x)) << 3
+        )
+
+    def _reset_damage(self):
+        self._dirty = set()
+        self._full = True
+        self._panel = None
+
+    def visible(self, y, x):
+        return self.view_y <= y < self.view_y + self.rows and self.view_x <= x < self.view_x + self.cols
+
+    def show(self, y, x):
+        # scroll so that cell (y, x) is visible, centered if the view has to move
+        if not self.visible(y, x):
+            self.view_y = max(0, min(y - self.rows // 2, self.size_y - self.rows))
+            self.view_x = max(0, min(x - self.cols // 2, self.size_x - self.cols))
+            self._full = True
 
     def draw_outer(self):
-        outer_y = self.size_y * 2 + 1
-        for i in range(self.size_y):
+        outer_y = self.rows * 2 + 1
+        width = len(str(self.size_y))
+        for i in range(self.rows):
             scr.addstr(self.offset_y + 1 + i*2, self.offset_x,
-                       f'{self.size_y - i:2}')
-        for i in range(self.size_x):
-            scr.addstr(self.offset_y + outer_y, self.offset_x + 5 + 4*i,
-                       f'{i+1:2}')
-
-    def draw(self):
-        self.draw_outer()
-
-        for y, ff in enumerate(self.discs):
-            for x, f in enumerate(ff):
-                assert f >= 0
-                scr.addstr(self.screen_y(y), self.screen_x(x),
-                           '·' if f == 0 else 'o' if f == 1 else str(f))
-
-        def xofs(x):
-            return -1 if x == 0 else 1 if x == self.size_x else 0
-
-        for y, ww in enumerate(self.v_walls):
-            for x, w in enumerate(ww):
-                scr.addstr(self.screen_y(y), self.screen_x(x)-2+xofs(x),
-                           '│' if w else ' ')
-        for y, ww in enumerate(self.h_walls):
-            for x, w in enumerate(ww):
-                scr.addstr(self.screen_y(y)+1, self.screen_x(x)- (1 if x > 0 else 2),
-                           ('─' if w else ' ')*(4 if (x == 0 or (x+1) == self.size_x) else 3))
-        for y in range(self.size_y+1):
-            for x in range(self.size_x+1):
-                l = self.h_walls[y][x-1] if x > 0 else False
-                r = self.h_walls[y][x] if x < self.size_x else False
-                u = self.v_walls[y-1][x] if y > 0 else False
-                o = self.v_walls[y][x] if y < self.size_y else False
-                if r:
-                    if o:
-                        if u:
-                            c = '┼' if l else '├'
-                        else:
-                            c = '┴' if l else '└'
-                    else:
-                        if u:
-                            c = '┬' if l else '┌'
-                        else:
-                            c = '─' if l else ' '
-                else:
-                    if o:
-                        if u:
-                            c = '┤' if l else '│'
-                        else:
-                            c = '┘' if l else ' '
-                    else:
-                        if u:
-                            c = '┐' if l else ' '
-                        else:
-                            c = ' '
-                scr.addstr(self.screen_y(y)+1, self.screen_x(x)+xofs(x)-2, c)
-        for x in (self.screen_x(0) - 2, self.screen_x(self.size_x-1) + 2):
-            for y in (self.screen_y(0) + 1, self.screen_y(self.size_y-1) - 1):
+                       f'{self.view_y + self.rows - i:{max(width, 2)}}')
+        for x in range(self.view_x, self.view_x + self.cols):
+            scr.addstr(self.offset_y + outer_y, self.screen_x(x) - 2, f'{x+1:3} '[:4])
+        # the border columns stay empty where the field goes on beyond the view
+        for y in range(self.offset_y, self.offset_y + outer_y):
+            if self.view_x > 0:
+                scr.addstr(y, self.screen_x(self.view_x) - 3, ' ')
+            if self.view_x + self.cols < self.size_x:
+                scr.addstr(y, self.screen_x(self.view_x + self.cols - 1) + 3, ' ')
+
+    def draw(self, full=False):
+        if self.follow and not self.visible(self.ny, self.nx):
+            self.show(self.ny, self.nx)
+        if full or self._full:
+            ys = range(self.view_y, self.view_y + self.rows)
+            xs = range(self.view_x, self.view_x + self.cols)
+            self.draw_outer()
+            for y in ys:
+                for x in xs:
+                    self._draw_cell(y, x)
+            for y in ys:
+                for x in range(xs.start, xs.stop + 1):
+                    self._draw_v_wall(y, x)
+            for y in range(ys.start, ys.stop + 1):
+                for x in xs:
+                    self._draw_h_wall(y, x)
+            for y in range(ys.start, ys.stop + 1):
+                for x in range(xs.start, xs.stop + 1):
+                    self._draw_junction(y, x)
+            self._draw_corners()
+            self._panel = None
+        else:
+            y0, y1 = self.view_y, self.view_y + self.rows
+            x0, x1 = self.view_x, self.view_x + self.cols
+            corners = False
+            for kind, y, x in self._dirty:
+                if kind == 'c':
+                    if y0 <= y < y1 and x0 <= x < x1:
+                        self._draw_cell(y, x)
+                elif kind == 'v':
+                    if y0 <= y < y1 and x0 <= x <= x1:
+                        self._draw_v_wall(y, x)
+                elif kind == 'h':
+                    if y0 <= y <= y1 and x0 <= x < x1:
+                        self._draw_h_wall(y, x)
+                        corners = corners or y in (0, self.size_y)
+            for kind, y, x in self._dirty:
+                if kind == 'j' and y0 <= y <= y1 and x0 <= x <= x1:
+                    self._draw_junction(y, x)
+            if corners:
+                self._draw_corners()
+        self._dirty.clear()
+        self._full = False
+
+        self._draw_panel()
+
+        scr.noutrefresh()
+        curses.doupdate()
+
+    def _xofs(self, x):
+        return -1 if x == 0 else 1 if x == self.size_x else 0
+
+    def _draw_cell(self, y, x):
+        if (y, x) == (self.ny, self.nx):
+            d = self.direction
+            assert 0 <= d <= 3
+            c = '>' if d == 0 else '^' if d == 1 else '<' if d == 2 else 'v'
+        else:
+            f = self.discs[y*self.size_x + x]
+            c = '·' if f == 0 else 'o' if f == 1 else str(f)
+        scr.addstr(self.screen_y(y), self.screen_x(x), c)
+
+    def _draw_v_wall(self, y, x):
+        scr.addstr(self.screen_y(y), self.screen_x(x)-2+self._xofs(x),
+                   '│' if self.get_v_wall(y, x) else ' ')
+
+    def _draw_h_wall(self, y, x):
+        scr.addstr(self.screen_y(y)+1, self.screen_x(x) - (1 if x > 0 else 2),
+                   ('─' if self.get_h_wall(y, x) else ' ')*(4 if (x == 0 or (x+1) == self.size_x) else 3))
+
+    def _draw_junction(self, y, x):
+        scr.addstr(self.screen_y(y)+1, self.screen_x(x)+self._xofs(x)-2,
+                   _JUNCTIONS[self.junctions[y*(self.size_x+1) + x]])
+
+    def _draw_corners(self):
+        # only the corners of the field that are in view
+        xs = [self.screen_x(0) - 2] if self.view_x == 0 else []
+        if self.view_x + self.cols == self.size_x:
+            xs.append(self.screen_x(self.size_x-1) + 2)
+        ys = [self.screen_y(0) + 1] if self.view_y == 0 else []
+        if self.view_y + self.rows == self.size_y:
+            ys.append(self.screen_y(self.size_y-1) - 1)
+        for x in xs:
+            for y in ys:
                 scr.addstr(y, x, '─')
 
-
-        d = self.direction
-        assert 0 <= d <= 3
-        scr.addstr(self.screen_y(self.ny), self.screen_x(self.nx),
-                   '>' if d == 0 else '^' if d == 1 else '<' if d == 2 else 'v')
-
+    def _draw_panel(self):
         panel_x = self.panel_x
         panel_y = self.panel_y
-        scr.addstr(panel_y, panel_x, 'Feldname:')
-        scr.addstr(panel_y + 2, panel_x, self.name)
-        scr.addstr(panel_y + 5, panel_x, 'Position')
-        scr.addstr(panel_y + 7, panel_x, f'X={self.nx+1:2} Y={self.ny+1:2}')
-        scr.addstr(panel_y + 10, panel_x, 'Vorrat')
-        scr.addstr(panel_y + 12, panel_x, f'  {self.vorrat:02}')
-        if self.zustand is not None:
+        old = self._panel or (None, None, None, None, None)
+        stats = self.stats
+        new = (self.name, self.pos, self.vorrat, self.zustand,
+               (stats.actions, stats.sensors) if stats is not None else None)
+        if self._panel is None:
+            scr.addstr(panel_y, panel_x, 'Feldname:')
+            scr.addstr(panel_y + 5, panel_x, 'Position')
+            scr.addstr(panel_y + 10, panel_x, 'Vorrat')
+        if new[0] != old[0]:
+            scr.addstr(panel_y + 2, panel_x, self.name)
+        if new[1] != old[1]:
+            if self.size_y > 99 or self.size_x > 99:
+                scr.addstr(panel_y + 7, panel_x, f'X={self.nx+1:4}')
+                scr.addstr(panel_y + 8, panel_x, f'Y={self.ny+1:4}')
+            else:
+                scr.addstr(panel_y + 7, panel_x, f'X={self.nx+1:2} Y={self.ny+1:2}')
+        if new[2] != old[2]:
+            scr.addstr(panel_y + 12, panel_x, f'  {self.vorrat:02}')
+        if new[4] != old[4] and stats is not None:
+            scr.addstr(panel_y + 13, panel_x, f'Akt.{new[4][0]:>7}')
+            scr.addstr(panel_y + 14, panel_x, f'Sens.{new[4][1]:>6}')
+        if new[3] != old[3] and self.zustand is not None:
             scr.addstr(panel_y + 15, panel_x, 'Zustand')
             if self.zustand:
-                scr.addstr(panel_y + 17, panel_x + 2, 'an')
+                # the debugger can switch back on after an error
+                scr.addstr(panel_y + 17, panel_x + 2, 'an ')
+                scr.addstr(panel_y + 19, panel_x, ' ' * 8)
             else:
                 scr.addstr(panel_y + 17, panel_x + 2, 'aus')
                 scr.addstr(panel_y + 19, panel_x, '(Fehler)')
-
-        scr.refresh()
+        self._panel = new
 
     def get_discs(self, y, x):
-        return self.discs[y][x]
+        return self.discs[y*self.size_x + x]
 
     def set_discs(self, y, x, val):
-        self.discs[y][x] = val
-        self.draw()
+        self.discs[y*self.size_x + x] = val
+        self._dirty.add(('c', y, x))
+
+    def get_h_wall(self, y, x):
+        return _get_bit(self.h_walls, y*self.size_x + x)
 
     def set_h_wall(self, y, x, val):
-        self.h_walls[y][x] = val
-        self.draw()
+        if self._shared:
+            self._unshare()
+        _set_bit(self.h_walls, y*self.size_x + x, val)
+        self._update_free(y, x)
+        self._update_free(y-1, x)
+        self._update_junction(y, x)
+        self._update_junction(y, x+1)
+        self._dirty.update((('h', y, x), ('j', y, x), ('j', y, x+1)))
+
+    def get_v_wall(self, y, x):
+        return _get_bit(self.v_walls, y*(self.size_x+1) + x)
 
     def set_v_wall(self, y, x, val):
-        self.v_walls[y][x] = val
-        self.draw()
+        if self._shared:
+            self._unshare()
+        _set_bit(self.v_walls, y*(self.size_x+1) + x, val)
+        self._update_free(y, x)
+        self._update_free(y, x-1)
+        self._update_junction(y, x)
+        self._update_junction(y+1, x)
+        self._dirty.update((('v', y, x), ('j', y, x), ('j', y+1, x)))
 
     def screen_y(self, y):
-        return self.y0 - y*2
+        return self.y0 - (y - self.view_y)*2
 
     def screen_x(self, x):
-        return self.x0 + x*4
+        return self.x0 + (x - self.view_x)*4
 
     @property
     def pos(self):
@@ -145,8 +467,9 @@ class Field:
 
     @pos.setter
     def pos(self, val):
+        self._dirty.add(('c', self.ny, self.nx))
         self.ny, self.nx = val
-        self.draw()
+        self._dirty.add(('c', self.ny, self.nx))
 
     @property
     def direction(self):
@@ -155,14 +478,26 @@ class Field:
     @direction.setter
     def direction(self, val):
         self._direction = val
-        self.draw()
+        self._dirty.add(('c', self.ny, self.nx))
+
+
+def load_field(path):
+    with open(path, 'rb') as f:
+        return Field.from_bytes(f.read(), name=os.path.splitext(os.path.basename(path))[0])
+
+
+def save_field(field, path):
+    with open(path, 'wb') as f:
+        f.write(field.to_bytes())
 
 
 def edit_field(field):
     scr.clear()
-    field.draw()
-    curses.curs_set(1)
     y, x = 0, 0
+    field.follow = False
+    field.show(y, x)
+    field.draw(full=True)
+    curses.curs_set(1)
 
     def std_fist_line():
         print_first_line(
@@ -173,6 +508,8 @@ def edit_field(field):
         scr.move(field.screen_y(y), field.screen_x(x))
 
     while True:
+        field.show(y, x)
+        field.draw()
         std_fist_line()
         update_cursor()
 
@@ -242,5 +579,6 @@ def edit_field(field):
             field.vorrat = digits[0] * 10 + digits[1]
         else:
             pass
+    field.follow = True
     curses.curs_set(0)
     scr.clear()
@@ -0,0 +1,41 @@
+import bisect
+import os
+
+
+class DirectoryIndex:
+    # sorted file names (without extension) per extension, the directory is only read again
+    # after its modification time changed
+
+    def __init__(self, path='.'):
+        self.path = path
+        self._mtime = None
+        self._names = {}
+
+    def _mtime_now(self):
+        return os.stat(self.path).st_mtime_ns
+
+    def _scan(self):
+        mtime = self._mtime_now()
+        names = {}
+        with os.scandir(self.path) as entries:
+            for entry in entries:
+                name = entry.name
+                if name.startswith('.') or name == 'pyniki.py':
+                    continue
+                stem, dot, extension = name.rpartition('.')
+                if dot:
+                    names.setdefault(extension, []).append(name.split('.')[0])
+        for v in names.values():
+            v.sort()
+        self._names, self._mtime = names, mtime
+
+    def names(self, extension):
+        if self._mtime != self._mtime_now():
+            self._scan()
+        return self._names.setdefault(extension, [])
+
+    def find(self, extension, prefix):
+        # position of the first name with that prefix in the listing last returned by names()
+        names = self._names.get(extension, [])
+        i = bisect.bisect_left(names, prefix)
+        return i if i < len(names) and names[i].startswith(prefix) else -1
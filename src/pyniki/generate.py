@@ -0,0 +1,161 @@
+import argparse
+import functools
+import os
+import random
+import time
+
+from pyniki.archive import EXTENSION, append_fields
+from pyniki.field import Field, _pack, save_field
+
+
+def _random_bytes(rng, n):
+    return rng.getrandbits(8 * n).to_bytes(n, 'little') if n else b''
+
+
+def _threshold(p):
+    # random bytes below this value count as hits, p is rounded to multiples of 1/256
+    return max(0, min(256, round(p * 256)))
+
+
+@functools.lru_cache()
+def _flag_table(p):
+    t = _threshold(p)
+    return bytes(b < t for b in range(256))
+
+
+def _flags(rng, n, p):
+    return bytearray(_random_bytes(rng, n).translate(_flag_table(p)))
+
+
+def _maze(rng, size_y, size_x, v, h):
+    # randomised depth-first search, removes the walls along a spanning tree of all cells
+    v[:] = b'\1' * len(v)
+    h[:] = b'\1' * len(h)
+    visited = bytearray(size_y * size_x)
+    y, x = rng.randrange(size_y), rng.randrange(size_x)
+    visited[y*size_x + x] = 1
+    stack = [(y, x)]
+    while stack:
+        y, x = stack[-1]
+        neighbours = [(ny, nx) for ny, nx in ((y, x+1), (y+1, x), (y, x-1), (y-1, x))
+                      if 0 <= ny < size_y and 0 <= nx < size_x and not visited[ny*size_x + nx]]
+        if not neighbours:
+            stack.pop()
+            continue
+        ny, nx = neighbours[rng.randrange(len(neighbours))]
+        if ny == y:
+            v[y*(size_x+1) + max(x, nx)] = 0
+        else:
+            h[max(y, ny)*size_x + x] = 0
+        visited[ny*size_x + nx] = 1
+        stack.append((ny, nx))
+
+
+@functools.lru_cache()
+def _disc_table(p, max_discs):
+    t = _threshold(p)
+    return bytes(1 + b * max_discs // t if b < t else 0 for b in range(256))
+
+
+@functools.lru_cache()
+def _empty_field(size_y, size_x):
+    return Field(size_y, size_x, 1)
+
+
+def generate(seed, size_y=10, size_x=15, walls=0.2, maze=False, discs=0.1, max_discs=9,
+             pos=None, direction=None, vorrat=0, name=''):
+    rng = random.Random(seed)
+    field = _empty_field(size_y, size_x).copy()
+    field.name = name
+
+    # inner walls, one byte 0/1 per wall in the bit order of Field.v_walls and Field.h_walls
+    v = _flags(rng, size_y * (size_x + 1), walls)
+    h = _flags(rng, (size_y + 1) * size_x, walls)
+    if maze:
+        _maze(rng, size_y, size_x, v, h)
+    v[::size_x+1] = b'\1' * size_y
+    v[size_x::size_x+1] = b'\1' * size_y
+    h[:size_x] = h[-size_x:] = b'\1' * size_x
+    field.v_walls = _pack(v)
+    field.h_walls = _pack(h)
+
+    if discs:
+        field.discs = bytearray(_random_bytes(rng, size_y * size_x).translate(_disc_table(discs, max_discs)))
+    field.ny, field.nx = pos if pos is not None else (rng.randrange(size_y), rng.randrange(size_x))
+    field._direction = direction if direction is not None else rng.randrange(4)
+    field.vorrat = vorrat if isinstance(vorrat, int) else rng.randint(*vorrat)
+    field._init_masks()
+    return field
+
+
+def generate_fields(count, seed=0, prefix='ZUFALL', **options):
+    # field i only depends on seed and i, so single fields of a corpus can be recreated
+    width = len(str(count - 1))
+    for i in range(count):
+        yield generate(f'{seed}:{i}', name=f'{prefix}{i:0{width}}', **options)
+
+
+def _pair(sep, convert=int):
+    def parse(s):
+        a, b = s.split(sep)
+        return convert(a), convert(b)
+    return parse
+
+
+def _vorrat(s):
+    return _pair('-')(s) if '-' in s else int(s)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='pyniki generate',
+        description='Zufällige Roboterfelder (.rob) erzeugen. Gleiche Parameter ergeben immer die gleichen Felder.'
+    )
+    parser.add_argument('-n', '--count', type=int, default=100, help='Anzahl der Felder (Standard: 100)')
+    parser.add_argument('-s', '--seed', default='0', help='Startwert des Zufallsgenerators (Standard: 0)')
+    parser.add_argument('-o', '--output', default='.', metavar='VERZEICHNIS',
+                        help='Zielverzeichnis oder Feldarchiv (.robs), an das die Felder angehängt werden '
+                             '(Standard: aktuelles Verzeichnis)')
+    parser.add_argument('--prefix', default='ZUFALL', help='Anfang der Feldnamen (Standard: ZUFALL)')
+    parser.add_argument('--size', type=_pair('x'), default=(10, 15), metavar='ZEILENxSPALTEN',
+                        help='Feldgröße (Standard: 10x15)')
+    parser.add_argument('--walls', type=float, default=0.2, metavar='ANTEIL',
+                        help='Anteil der inneren Wände (Standard: 0.2)')
+    parser.add_argument('--maze', action='store_true', help='Labyrinth erzeugen, --walls wird ignoriert')
+    parser.add_argument('--discs', type=float, default=0.1, metavar='ANTEIL',
+                        help='Anteil der Plätze mit Scheiben (Standard: 0.1)')
+    parser.add_argument('--max-discs', type=int, default=9, choices=range(1, 10), metavar='N',
+                        help='höchstens N Scheiben pro Platz (Standard: 9)')
+    parser.add_argument('--position', type=_pair(','), metavar='X,Y',
+                        help='Startposition von Niki (Standard: zufällig)')
+    parser.add_argument('--direction', type=int, choices=range(4), metavar='R',
+                        help='Startrichtung von Niki, 0 bis 3 (Standard: zufällig)')
+    parser.add_argument('--vorrat', type=_vorrat, default=0, metavar='N|N-M',
+                        help='Vorrat von Niki, fest oder zufällig zwischen N und M (Standard: 0)')
+    args = parser.parse_args(argv)
+
+    size_y, size_x = args.size
+    if size_y < 1 or size_x < 1:
+        parser.error('ungültige Feldgröße')
+    pos = None
+    if args.position is not None:
+        x, y = args.position
+        if not (1 <= x <= size_x and 1 <= y <= size_y):
+            parser.error('Startposition außerhalb des Feldes')
+        pos = (y - 1, x - 1)
+    vorrat = args.vorrat if isinstance(args.vorrat, tuple) else (args.vorrat, args.vorrat)
+    if not 0 <= vorrat[0] <= vorrat[1] <= 99:
+        parser.error('ungültiger Vorrat')
+
+    start = time.perf_counter()
+    fields = generate_fields(args.count, args.seed, args.prefix, size_y=size_y, size_x=size_x,
+                             walls=args.walls, maze=args.maze, discs=args.discs, max_discs=args.max_discs,
+                             pos=pos, direction=args.direction, vorrat=args.vorrat)
+    if args.output.endswith(EXTENSION):
+        append_fields(args.output, fields)
+    else:
+        os.makedirs(args.output, exist_ok=True)
+        for field in fields:
+            save_field(field, os.path.join(args.output, field.name + '.rob'))
+    print(f'{args.count} Felder in {time.perf_counter() - start:.2f}s erzeugt')
+    return 0
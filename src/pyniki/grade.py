@@ -0,0 +1,198 @@
+import argparse
+import collections
+import functools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from pyniki.archive import EXTENSION, FieldArchive
+from pyniki.cache import code_cache
+from pyniki.field import load_field
+from pyniki.sim import Simulator
+from pyniki.stats import Stats
+
+
+def field_state(field):
+    return {
+        'position': [field.nx + 1, field.ny + 1],
+        'direction': field.direction,
+        'vorrat': field.vorrat,
+        'zustand': field.zustand,
+        'discs': [[field.get_discs(y, x) for x in range(field.size_x)] for y in range(field.size_y)],
+    }
+
+
+def grade(program, field, stats=False, **options):
+    start = time.perf_counter()
+    sim = Simulator(program, field, stats=Stats(timing=True) if stats else None, **options)
+    try:
+        sim.run()
+    except (Exception, SystemExit) as e:  # exit() in a program must not end the batch
+        sim.error = 'exception'
+        sim.error_name = type(e).__name__
+        sim.error_line = sim.program_line(e.__traceback__) if sim.code is not None else None
+        sim.field.zustand = False
+    result = {
+        'error': sim.error,
+        'error_line': sim.error_line,
+        'error_name': sim.error_name,
+        'steps': sim.steps,
+        'sensor_calls': sim.sensor_calls,
+        'time': time.perf_counter() - start,
+        'state': field_state(sim.field),
+    }
+    if stats:
+        result['stats'] = sim.stats.as_dict()
+    return result
+
+
+@functools.lru_cache()
+def _archive(path):
+    # one mapping per worker process, the pages are shared with all other workers
+    return FieldArchive(path)
+
+
+def _load(field):
+    if isinstance(field, tuple):
+        path, name = field
+        return _archive(path)[name]
+    return field
+
+
+def _grade_job(job):
+    program_path, program, field_path, field, options = job
+    result = grade(program, _load(field), **options)
+    return dict(program=program_path, field=field_path, **result)
+
+
+def _grade_chunk(jobs):
+    return [_grade_job(job) for job in jobs]
+
+
+def _crashed(job):
+    # result of a job whose process ended without answering
+    program_path, _, field_path, field, options = job
+    state = field_state(_load(field))
+    state['zustand'] = False
+    result = {'error': 'crash', 'error_line': None, 'error_name': None, 'steps': 0, 'sensor_calls': 0,
+              'time': 0., 'state': state}
+    if options['stats']:
+        result['stats'] = Stats(timing=True).as_dict()
+    return dict(program=program_path, field=field_path, **result)
+
+
+def _init_worker(cache_dir):
+    code_cache.path = cache_dir
+    # programs must not be able to corrupt the result stream
+    sys.stdout = open(os.devnull, 'w')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='pyniki grade',
+        description='Alle Roboterprogramme (.py) auf allen Roboterfeldern (.rob, .robs) ausführen.'
+    )
+    parser.add_argument('files', nargs='+', metavar='DATEI', help='Roboterprogramme, Roboterfelder und Feldarchive')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help='Anzahl paralleler Prozesse (Standard: Anzahl der CPU-Kerne)')
+    parser.add_argument('-o', '--output', default='-',
+                        help='Ausgabedatei für die Ergebnisse als JSON Lines (Standard: stdout)')
+    parser.add_argument('--cache', metavar='VERZEICHNIS',
+                        help='übersetzte Programme in diesem Verzeichnis zwischenspeichern')
+    parser.add_argument('--max-steps', type=int, metavar='N',
+                        help='Programm nach N Aktionen abbrechen')
+    parser.add_argument('--max-sensors', type=int, metavar='N',
+                        help='Programm nach N Sensorabfragen abbrechen')
+    parser.add_argument('--max-time', type=float, metavar='SEKUNDEN',
+                        help='Programm nach dieser Laufzeit abbrechen')
+    parser.add_argument('--fast', action='store_true',
+                        help='Programme mit eingebetteten Niki-Funktionen übersetzen und schneller ausführen')
+    parser.add_argument('--stats', action='store_true',
+                        help='Aufrufe und Laufzeit jeder Niki-Funktion ausgeben')
+    parser.add_argument('--sandbox', action='store_true',
+                        help='Programme in Prozessen ohne Datei- und Prozesszugriff mit begrenzten Mitteln ausführen')
+    parser.add_argument('--max-cpu', type=float, metavar='SEKUNDEN',
+                        help='mit --sandbox: CPU-Zeit je Lauf (Standard: 10)')
+    parser.add_argument('--max-memory', type=int, metavar='MiB',
+                        help='mit --sandbox: zusätzlicher Speicher je Prozess (Standard: 512)')
+    args = parser.parse_args(argv)
+    if args.fast and args.stats:
+        parser.error('--fast und --stats können nicht zusammen verwendet werden')
+    options = {'max_steps': args.max_steps, 'max_sensors': args.max_sensors, 'max_time': args.max_time,
+               'fast': args.fast, 'stats': args.stats}
+
+    programs, fields = [], []
+    for path in args.files:
+        if path.endswith('.py'):
+            with open(path, 'rt') as f:
+                programs.append((path, f.read()))
+        elif path.endswith('.rob'):
+            fields.append((path, load_field(path)))
+        elif path.endswith(EXTENSION):
+            # only (archive, name) is sent to the workers, they read the fields themselves
+            with FieldArchive(path) as archive:
+                fields.extend((f'{path}:{name}', (path, name)) for name in archive)
+        else:
+            parser.error(f'unbekannter Dateityp: {path}')
+    if not programs or not fields:
+        parser.error('mindestens ein Roboterprogramm und ein Roboterfeld angeben')
+
+    jobs = [(pp, p, fp, f, options) for pp, p in programs for fp, f in fields]
+    out = sys.stdout if args.output == '-' else open(args.output, 'wt')
+    try:
+        if args.sandbox:
+            _grade_sandboxed(jobs, args, out)
+            return 0
+        _grade_pooled(jobs, args, out)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+
+def _grade_pooled(jobs, args, out):
+    # a job that ends its process (os._exit(), a segfault) breaks the whole pool: the first
+    # unfinished chunk is split into single jobs for a fresh pool, a single job that breaks it runs
+    # once more on its own and is reported as 'crash' if it breaks that pool too
+    chunksize = max(1, len(jobs) // (4 * args.jobs))
+    pending = collections.deque(jobs[i:i + chunksize] for i in range(0, len(jobs), chunksize))
+    while pending:
+        with ProcessPoolExecutor(args.jobs, initializer=_init_worker, initargs=(args.cache,)) as executor:
+            futures = collections.deque(executor.submit(_grade_chunk, chunk) for chunk in pending)
+            try:
+                while futures:
+                    for result in futures[0].result():
+                        out.write(json.dumps(result) + '\n')
+                    futures.popleft()
+                    pending.popleft()
+            except BrokenProcessPool:
+                pass
+        if not pending:
+            break
+        chunk = pending.popleft()
+        if len(chunk) > 1:
+            pending.extendleft([job] for job in reversed(chunk))
+            continue
+        with ProcessPoolExecutor(1, initializer=_init_worker, initargs=(args.cache,)) as executor:
+            try:
+                result = executor.submit(_grade_job, chunk[0]).result()
+            except BrokenProcessPool:
+                result = _crashed(chunk[0])
+        out.write(json.dumps(result) + '\n')
+
+
+def _grade_sandboxed(jobs, args, out):
+    from pyniki.sandbox import WorkerPool
+    code_cache.path = args.cache  # programs are compiled here, before they go to a worker
+    limits = {}
+    if args.max_cpu is not None:
+        limits['cpu'] = args.max_cpu
+    if args.max_memory is not None:
+        limits['memory'] = args.max_memory * 2**20
+    with WorkerPool(args.jobs, **limits) as pool:
+        results = pool.grade((program, _load(field), options) for _, program, _, field, options in jobs)
+        for (program_path, _, field_path, _, _), result in zip(jobs, results):
+            out.write(json.dumps(dict(program=program_path, field=field_path, **result)) + '\n')
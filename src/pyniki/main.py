@@ -1,15 +1,16 @@
 import curses
-import glob
 import os
-import pathlib
 import pickle
-import subprocess
+import sys
 
 from pyniki.curses import curses_disabled, curses_setup, scr
-from pyniki.field import Field, edit_field
-from pyniki.sim import run_program
+from pyniki.field import Field, edit_field, load_field, save_field
+from pyniki.files import DirectoryIndex
 from pyniki.ui import draw_frame, print_last_line
 
+# largest field that can be created in the menu, larger ones are shown scrolled
+MAX_FIELD_SIZE = 1000
+
 
 class Word:
     def __init__(self, y, x, txt, highlight=False):
@@ -125,26 +126,27 @@ class FileDialog:
 
     def __init__(self, y, extension):
         self.y = y
+        self.index = DirectoryIndex()
+        self.search = ''
         self.set_extension(extension)
 
+    def _row(self, sy):
+        return self.names[sy*4:sy*4+4]
+
     def _update_words(self):
+        # only the visible rows get words
         word_array = []
-        for iy, row in enumerate(self.path_array[self.oy:self.oy+7]):
+        for iy in range(self.oy, min(self.oy+7, self.rows)):
             wr = []
-            for ix, p in enumerate(row):
-                wr.append(Word(self.y+1+iy, 1+ix*21, p, False))
+            for ix, p in enumerate(self._row(iy)):
+                wr.append(Word(self.y+1+iy-self.oy, 1+ix*21, p, False))
             word_array.append(wr)
         self.word_array = word_array
 
     def set_extension(self, extension):
         self.extension = extension
-        paths = [w.split('.')[0] for w in sorted(glob.glob(f'*.{extension}'))
-                 if not w == 'pyniki.py']
-        path_array = []
-        while paths:
-            row, paths = paths[:4], paths[4:]
-            path_array.append(row)
-        self.path_array = path_array
+        self.names = self.index.names(extension)
+        self.rows = (len(self.names) + 3) // 4
         self.sy, self.sx, self.oy = -1, -1, 0
         self._update_words()
 
@@ -176,13 +178,22 @@ class FileDialog:
             return None
 
         self.set_selected(0, 0)
+        self.search = ''
 
         while True:
             key = scr.getch()
+            if key in range(ord('a'), ord('z')+1) or key in range(ord('0'), ord('9')+1):
+                # jump to the first name starting with the letters typed so far
+                i = self.index.find(self.extension, self.search + chr(key).upper())
+                if i >= 0:
+                    self.search += chr(key).upper()
+                    self.set_selected(i // 4, i % 4)
+                continue
+            self.search = ''
             if key == curses.KEY_RIGHT:
-                if self.sx + 1 < len(self.path_array[self.sy]):
+                if self.sx + 1 < len(self._row(self.sy)):
                     self.set_selected(self.sy, self.sx+1)
-                elif self.sy + 1 < len(self.path_array):
+                elif self.sy + 1 < self.rows:
                     self.set_selected(self.sy+1, 0)
             elif key == curses.KEY_LEFT:
                 if self.sx > 0:
@@ -193,10 +204,15 @@ class FileDialog:
                 if self.sy > 0:
                     self.set_selected(self.sy-1, self.sx)
             elif key == curses.KEY_DOWN:
-                if self.sy + 1 < len(self.path_array):
-                    self.set_selected(self.sy+1, min(self.sx, len(self.path_array[self.sy+1])-1))
+                if self.sy + 1 < self.rows:
+                    self.set_selected(self.sy+1, min(self.sx, len(self._row(self.sy+1))-1))
+            elif key == curses.KEY_PPAGE:
+                self.set_selected(max(self.sy-7, 0), self.sx)
+            elif key == curses.KEY_NPAGE:
+                sy = min(self.sy+7, self.rows-1)
+                self.set_selected(sy, min(self.sx, len(self._row(sy))-1))
             elif key == ord('\n'):
-                retval = self.path_array[self.sy][self.sx]
+                retval = self._row(self.sy)[self.sx]
                 self.set_selected(-1, -1)
                 return retval
             elif key == 27:
@@ -281,16 +297,63 @@ o    oo  o  o  o  o     o   o   ooo   oooo    ooo     o    ooooo  o   o
 
     def save_field(self):
         filename = self.field_dialog.filename.txt + '.rob'
-        with open(filename, 'wb') as f:
-            pickle.dump(self.field, f)
+        save_field(self.field, filename)
+
+    def load_field(self, filename, old_filename):
+        # a broken or foreign file keeps the field loaded before
+        try:
+            field = load_field(filename)
+        except (ValueError, pickle.UnpicklingError, EOFError) as e:
+            print_last_line(f'Feld nicht geladen: {e}'[:59].ljust(60) + '<Leertaste drücken>')
+            while scr.getch() != ord(' '):
+                pass
+            print_last_line('')
+            self.field_dialog.filename.txt = old_filename
+            self.field_dialog.draw()
+            return False
+        field.name = self.field_dialog.filename.txt
+        self.field = field
+        return True
 
     def edit_program(self):
+        import subprocess
         with curses_disabled():
             p = subprocess.run(['micro', '-tabstospaces', 'true', '-filetype', 'python'],
                                input=self.program.encode(),
                                capture_output=True)
             self.program = p.stdout.decode()
 
+    def field_size_dialog(self):
+        draw_frame(5, 60, 16, 10)
+        prompt = f'Feldgröße Zeilen x Spalten (bis {MAX_FIELD_SIZE}x{MAX_FIELD_SIZE}): '
+        scr.addstr(18, 12, prompt)
+        y, x = 18, 12 + len(prompt)
+        txt = '10x15'
+        size = None
+        curses.curs_set(1)
+        while True:
+            scr.addstr(y, x, f'{txt:9}')
+            scr.move(y, x + len(txt))
+            key = scr.getch()
+            if key in range(ord('0'), ord('9')+1) and len(txt) < 9:
+                txt += chr(key)
+            elif key == ord('x') and 'x' not in txt:
+                txt += 'x'
+            elif key == curses.KEY_BACKSPACE:
+                txt = txt[:-1]
+            elif key == 27:
+                break
+            elif key == ord('\n'):
+                size_y, _, size_x = txt.partition('x')
+                if (size_y.isdigit() and size_x.isdigit()
+                        and 1 <= int(size_y) <= MAX_FIELD_SIZE and 1 <= int(size_x) <= MAX_FIELD_SIZE):
+                    size = int(size_y), int(size_x)
+                    break
+        curses.curs_set(0)
+        scr.clear()
+        self.draw()
+        return size
+
     def quit_dialog(self):
         draw_frame(7, 60, 16, 10)
         scr.addstr(17, 11, 'Niki-Programm beenden (j/n)? ')
@@ -370,9 +433,7 @@ o    oo  o  o  o  o     o   o   ooo   oooo    ooo     o    ooooo  o   o
                     with open(filename, 'rt') as f:
                         self.program = f.read()
                 else:
-                    with open(filename, 'rb') as f:
-                        self.field = pickle.load(f)
-                        self.field.name = field_dialog.filename.txt
+                    self.load_field(filename, old_filename)
             elif CMD == 'SAVE':
                 if active_dialog is robot_dialog:
                     if self.program is None:
@@ -414,10 +475,8 @@ o    oo  o  o  o  o     o   o   ooo   oooo    ooo     o    ooooo  o   o
                     if active_dialog is robot_dialog:
                         with open(filename, 'rt') as f:
                             self.program = f.read()
-                    else:
-                        with open(filename, 'rb') as f:
-                            self.field = pickle.load(f)
-                            self.field.name = field_dialog.filename.txt
+                    elif not self.load_field(filename, old_filename):
+                        continue
 
                 if active_dialog is robot_dialog:
                     self.edit_program()
@@ -426,12 +485,16 @@ o    oo  o  o  o  o     o   o   ooo   oooo    ooo     o    ooooo  o   o
                     edit_field(self.field)
                     self.draw()
             elif CMD == 'NEW':
+                if active_dialog is field_dialog:
+                    size = self.field_size_dialog()
+                    if size is None:
+                        continue
                 active_dialog.filename.txt = 'NONAME'
                 if active_dialog is robot_dialog:
                     self.program = ''
                     self.edit_program()
                 else:
-                    self.field = Field(10, 15, 1, name=self.field_dialog.filename.txt)
+                    self.field = Field(*size, 1, name=self.field_dialog.filename.txt)
                     edit_field(self.field)
                 self.draw()
             elif CMD == 'RUN':
@@ -451,6 +514,7 @@ o    oo  o  o  o  o     o   o   ooo   oooo    ooo     o    ooooo  o   o
                         pass
                     print_last_line('')
                     continue
+                from pyniki.sim import run_program
                 run_program(self.program, self.field)
                 self.draw()
             elif CMD == 'QUIT':
@@ -459,11 +523,30 @@ o    oo  o  o  o  o     o   o   ooo   oooo    ooo     o    ooooo  o   o
 
 
 def run():
-    path = pathlib.Path.home() / 'pyniki'
-    path.mkdir(exist_ok=True)
+    if sys.argv[1:2] == ['grade']:
+        from pyniki.grade import main
+        sys.exit(main(sys.argv[2:]))
+    if sys.argv[1:2] == ['generate']:
+        from pyniki.generate import main
+        sys.exit(main(sys.argv[2:]))
+    if sys.argv[1:2] == ['serve']:
+        from pyniki.serve import main
+        sys.exit(main(sys.argv[2:]))
+    pool = None
+    if sys.argv[1:2] == ['--sandbox']:
+        # workers are forked before curses starts, they get nothing of the terminal
+        from pyniki import sim
+        from pyniki.sandbox import WorkerPool
+        pool = sim.pool = WorkerPool()
+    path = os.path.join(os.path.expanduser('~'), 'pyniki')
+    os.makedirs(path, exist_ok=True)
     os.chdir(path)
-    with curses_setup():
-        MainMenu().run()
+    try:
+        with curses_setup():
+            MainMenu().run()
+    finally:
+        if pool is not None:
+            pool.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,536 @@
+import json
+import math
+import os
+import resource
+import select
+import signal
+import struct
+import time
+from array import array
+
+from pyniki.debug import program_line
+from pyniki.field import Field
+from pyniki.grade import field_state, grade
+from pyniki.sim import LimitError, Simulator
+from pyniki.stats import Stats
+from pyniki.trace import ACTIONS, GIB_AB, NIMM_AUF, SENSOR, SENSORS, VOR, apply, wrap
+
+# Programs run in pre-forked worker processes with bounded memory and CPU time that can not
+# write to files and, unless run as root, not start processes. The file system is not isolated,
+# a program can still read, empty and delete whatever the user running the workers may. A
+# worker streams the actions of a run with their program lines and the sensor answers back,
+# the parent replays them on its own copy of the field, so steps and final state are its own.
+# A program may write to the pipe itself: nothing the worker sends is unpickled, messages are
+# read without blocking and carry the number of their job, and a worker that sends anything
+# out of order is replaced.
+
+CPU = 10  # seconds per run
+MEMORY = 512 * 2**20  # bytes per worker, on top of what it inherits
+JOBS_PER_WORKER = 100
+
+# message on a pipe: kind, number of the job on its worker, payload length, payload
+_MESSAGE = struct.Struct('<cII')
+_MAX_MESSAGE = 64 * 2**20
+_FLUSH_EVENTS = 4096
+_FLUSH_TIME = 0.05
+# errors a worker may report, crash only comes from the parent
+_ERRORS = {None, 'indentation', 'syntax', 'niki', 'name', 'limit', 'exception'}
+
+
+def _write(fd, kind, job, payload):
+    data = _MESSAGE.pack(kind, job, len(payload)) + payload
+    while data:
+        data = data[os.write(fd, data):]
+
+
+def _read_exactly(fd, n):
+    chunks = []
+    while n:
+        chunk = os.read(fd, min(n, 2**20))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        n -= len(chunk)
+    return b''.join(chunks)
+
+
+def _read(fd):
+    # blocking, only for the jobs the worker gets from the parent
+    header = _read_exactly(fd, _MESSAGE.size)
+    if header is None:
+        return None, None, None
+    kind, job, n = _MESSAGE.unpack(header)
+    if n > _MAX_MESSAGE:
+        raise ValueError('Nachricht zu lang')
+    payload = _read_exactly(fd, n)
+    if payload is None:
+        return None, None, None
+    return kind, job, payload
+
+
+class _Stream:
+    # trace of a run in the worker: sends actions (E) with their program lines and sensor answers
+
+    def __init__(self, fd, job):
+        self.fd = fd
+        self.job = job
+        self.events = bytearray()
+        self.lines = array('I')
+        self.flushed = time.perf_counter()
+        self.error = False
+        self.error_line = None
+
+    def start(self, field):
+        pass
+
+    def flush(self):
+        if self.events:
+            payload = struct.pack('<I', len(self.events)) + self.events + self.lines.tobytes()
+            _write(self.fd, b'E', self.job, payload)
+            self.events = bytearray()
+            self.lines = array('I')
+        self.flushed = time.perf_counter()
+
+    def add(self, event):
+        self.events.append(event)
+        if len(self.events) >= _FLUSH_EVENTS or time.perf_counter() - self.flushed > _FLUSH_TIME:
+            self.flush()
+
+    def line(self, frame):
+        return program_line(frame)
+
+    def record(self, event, line):
+        self.lines.append(line)
+        self.add(event)
+
+    sense = add
+
+    def wrap(self, namespace):
+        return wrap(namespace, self)
+
+
+def _cpu_time():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _address_space():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[0]) * resource.getpagesize()
+    except OSError:
+        return 0
+
+
+def _has_children():
+    try:
+        os.waitpid(-1, os.WNOHANG)
+    except ChildProcessError:
+        return False
+    return True
+
+
+def _worker(jobs, results, cpu, memory, jobs_per_worker):
+    # body of a worker process, reads jobs (J) and answers with events (E) and a result, R or X
+    # for the last one of this worker
+    pid = os.getpid()
+    running = False
+
+    def cpu_exceeded(signum, frame):
+        if running:
+            raise LimitError('cpu')
+
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+    os.dup2(jobs, 3)
+    os.dup2(results, 4)
+    jobs, results = 3, 4
+    os.closerange(5, resource.getrlimit(resource.RLIMIT_NOFILE)[0])
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGXCPU, cpu_exceeded)
+    # enough CPU time for all runs of this worker; each run gets its own soft limit below
+    budget = math.ceil(_cpu_time() + cpu * (jobs_per_worker + 1))
+    resource.setrlimit(resource.RLIMIT_CPU, (budget, budget))
+    resource.setrlimit(resource.RLIMIT_AS, (_address_space() + memory,) * 2)
+    resource.setrlimit(resource.RLIMIT_FSIZE, (0, 0))
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+    resource.setrlimit(resource.RLIMIT_NPROC, (0, 0))  # not for root
+    # only a bound, a program can close one of these descriptors and open a file instead
+    resource.setrlimit(resource.RLIMIT_NOFILE, (5, 5))
+    while True:
+        kind, number, payload = _read(jobs)
+        if kind != b'J':
+            break
+        n, = struct.unpack_from('<I', payload)
+        job = json.loads(payload[4:4 + n])
+        field = Field.from_bytes(payload[4 + n:])
+        stream = _Stream(results, number)
+        resource.setrlimit(resource.RLIMIT_CPU, (min(budget, math.ceil(_cpu_time() + cpu)), budget))
+        running = True
+        try:
+            result = grade(job['program'], field, trace=stream, **job['options'])
+        except LimitError:
+            result = {'error': 'limit', 'error_name': 'cpu'}
+        running = False
+        if os.getpid() != pid:
+            os._exit(0)  # a copy the program forked
+        stream.flush()
+        if result.get('error_line') is None:
+            result['error_line'] = stream.error_line
+        forked = _has_children()
+        _write(results, b'X' if forked else b'R', number, json.dumps(result).encode())
+        if forked:
+            break
+
+
+class Worker:
+
+    def __init__(self, cpu=CPU, memory=MEMORY, jobs_per_worker=JOBS_PER_WORKER):
+        jobs_r, jobs_w = os.pipe()
+        results_r, results_w = os.pipe()
+        self.pid = os.fork()
+        if self.pid == 0:
+            try:
+                os.setpgid(0, 0)
+                os.close(jobs_w)
+                os.close(results_r)
+                _worker(jobs_r, results_w, cpu, memory, jobs_per_worker)
+            finally:
+                os._exit(0)
+        # own process group, so kill() also stops the processes a program started
+        try:
+            os.setpgid(self.pid, self.pid)
+        except OSError:
+            pass
+        os.close(jobs_r)
+        os.close(results_w)
+        os.set_blocking(results_r, False)
+        self.jobs, self.results = jobs_w, results_r
+        self.runs = 0
+        self.buffer = bytearray()  # the part of the next message read so far
+
+    def fileno(self):
+        return self.results
+
+    def send(self, program, field, options):
+        # returns the number of the job, the worker tags its messages with it
+        job = json.dumps({'program': program, 'options': options}).encode()
+        self.runs += 1
+        _write(self.jobs, b'J', self.runs, struct.pack('<I', len(job)) + job + field.to_bytes())
+        return self.runs
+
+    def receive(self):
+        # reads without blocking, but not beyond the next message; returns it as (kind, job,
+        # payload) once complete, else None, kind None once the worker closed its pipe or sent
+        # something too long
+        buffer = self.buffer
+        while True:
+            size = _MESSAGE.size
+            if len(buffer) >= size:
+                kind, job, n = _MESSAGE.unpack_from(buffer)
+                if n > _MAX_MESSAGE:
+                    return None, None, None
+                size += n
+                if len(buffer) == size:
+                    self.buffer = bytearray()
+                    return kind, job, bytes(buffer[_MESSAGE.size:])
+            try:
+                chunk = os.read(self.results, min(size - len(buffer), 2**20))
+            except BlockingIOError:
+                return None
+            except OSError:
+                return None, None, None
+            if not chunk:
+                return None, None, None
+            buffer += chunk
+
+    def kill(self):
+        # returns the name of the signal or exit status that ended the worker
+        try:
+            os.killpg(self.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        _, status = os.waitpid(self.pid, 0)
+        os.close(self.jobs)
+        os.close(self.results)
+        if os.WIFSIGNALED(status) and os.WTERMSIG(status) != signal.SIGKILL:
+            return signal.Signals(os.WTERMSIG(status)).name
+        if os.WIFEXITED(status):
+            return f'exit {os.WEXITSTATUS(status)}'
+        return None
+
+
+class WorkerPool:
+
+    def __init__(self, size=1, cpu=CPU, memory=MEMORY, jobs_per_worker=JOBS_PER_WORKER, timeout=None):
+        self.size = size
+        self.limits = {'cpu': cpu, 'memory': memory, 'jobs_per_worker': jobs_per_worker}
+        # a worker that sends nothing for this long is stopped, e.g. a program that sleeps
+        self.timeout = timeout if timeout is not None else cpu + 5
+        self.idle = [Worker(**self.limits) for _ in range(size)]
+
+    def acquire(self):
+        return self.idle.pop() if self.idle else Worker(**self.limits)
+
+    def release(self, worker):
+        if worker.runs < self.limits['jobs_per_worker'] and len(self.idle) < self.size:
+            self.idle.append(worker)
+        else:
+            self.replace(worker)
+
+    def replace(self, worker):
+        # stops worker and forks a fresh one, returns how the old one ended
+        end = worker.kill()
+        if len(self.idle) < self.size:
+            self.idle.append(Worker(**self.limits))
+        return end
+
+    def run(self, program, field, **kwargs):
+        return SandboxRun(self, program, field, **kwargs)
+
+    def start(self, program, field, options):
+        # starts a run, options as for grade(); run.result is set once run.done
+        options = dict(options)
+        stats = Stats(timing=True) if options.pop('stats', False) else None
+        run = SandboxRun(self, program, field, stats=stats, **options)
+        run.start()
+        return run
+
+    def grade(self, jobs):
+        # jobs: (program, field, options as for grade()), yields the results in order
+        jobs = iter(enumerate(jobs))
+        running = {}
+        results = {}
+        done = 0
+        while True:
+            while len(running) < self.size:
+                try:
+                    i, (program, field, options) = next(jobs)
+                except StopIteration:
+                    break
+                run = self.start(program, field, options)
+                if run.done:
+                    results[i] = run.result
+                else:
+                    running[run] = i
+            while done in results:
+                yield results.pop(done)
+                done += 1
+            if not running:
+                break
+            timeout = max(0, min(run.deadline for run in running) - time.monotonic())
+            ready = select.select(list(running), [], [], timeout)[0]
+            for run in running:
+                if run in ready or time.monotonic() > run.deadline:
+                    run.advance(math.inf, block=False)
+            for run in [run for run in running if run.done]:
+                results[running.pop(run)] = run.result
+
+    def close(self):
+        for worker in self.idle:
+            worker.kill()
+        self.idle = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SandboxRun(Simulator):
+    # runs in a worker of pool and replays the streamed events on self.field; advance() and
+    # abort() work as for the Stepper, a trace must be a Recorder. fast is ignored, a run in
+    # fast mode could not stream its actions.
+
+    def __init__(self, pool, program, field, **kwargs):
+        kwargs.pop('fast', None)
+        super().__init__(program, field, **kwargs)
+        self.pool = pool
+        self.worker = None
+        self.job = None
+        self._received = False  # a message of this job
+        self.result = None
+        self.done = False
+        self.deadline = None
+        self._started = None
+        self._events = b''
+        self._lines = array('I')
+        self._event = 0
+        self._line = 0
+
+    def fileno(self):
+        return self.worker.fileno()
+
+    def start(self):
+        self._started = time.perf_counter()
+        if not self._start():
+            self._stop(self._result(self.error, error_line=self.error_line))
+            return False
+        self._send(self.pool.acquire())
+        return not self.done
+
+    def _send(self, worker):
+        options = {'max_steps': self.max_steps, 'max_sensors': self.max_sensors, 'max_time': self.max_time,
+                   'stats': self.stats is not None and self.stats.timing}
+        self.worker = worker
+        self.deadline = time.monotonic() + self.pool.timeout
+        self._received = False
+        try:
+            self.job = worker.send(self.program, self.field, options)
+        except OSError:
+            self._crash()
+
+    def receive(self, block=True):
+        # handles one complete message of the worker, waits for it at most until the deadline or,
+        # without block, not at all; False if there was none
+        while (message := self.worker.receive()) is None:
+            timeout = max(0, self.deadline - time.monotonic())
+            if timeout == 0:
+                self._crash(timeout=True)
+                return False
+            if not block:
+                return False
+            select.select([self.worker], [], [], timeout)
+        kind, job, payload = message
+        self.deadline = time.monotonic() + self.pool.timeout
+        if job is not None and job < self.job and not self._received:
+            # left over from a program of the previous job that wrote to the pipe itself, this
+            # job has not started to report yet and runs again on a fresh worker
+            self.pool.replace(self.worker)
+            self._send(self.pool.acquire())
+            return True
+        self._received = True
+        try:
+            if job != self.job:
+                raise ValueError('Nachricht eines anderen Auftrags')
+            if kind == b'E':
+                n, = struct.unpack_from('<I', payload)
+                self._events = payload[4:4 + n]
+                self._lines = array('I', payload[4 + n:])
+                self._event = self._line = 0
+            elif kind in (b'R', b'X'):
+                self._finish_run(kind, json.loads(payload))
+            else:
+                self._crash()
+        except (ValueError, TypeError, KeyError, struct.error):
+            self._crash()
+        return True
+
+    def _finish_run(self, kind, result):
+        # steps, sensor calls and state are those of the replayed events, only the error and the
+        # times are taken from the worker
+        if not isinstance(result, dict) or result.get('error') not in _ERRORS:
+            raise ValueError('kein Ergebnis')
+        error_line, error_name, run_time = result.get('error_line'), result.get('error_name'), result.get('time')
+        if (not (error_line is None or isinstance(error_line, int))
+                or not (error_name is None or isinstance(error_name, str))
+                or not (run_time is None or isinstance(run_time, float))):
+            raise ValueError('ungültiges Ergebnis')
+        stats = result.get('stats')
+        if self.stats is not None and isinstance(stats, dict) and isinstance(stats.get('times'), dict):
+            self.stats.times.update((name, t) for name, t in stats['times'].items()
+                                    if name in self.stats.times and isinstance(t, float))
+        if kind == b'R' and not select.select([self.worker], [], [], 0)[0]:
+            self.pool.release(self.worker)
+        else:
+            self.pool.replace(self.worker)  # the last job of this worker, or it sent more
+        result = self._result(result['error'], error_name, error_line)
+        if run_time is not None:
+            result['time'] = run_time
+        self._stop(result)
+
+    def advance(self, n=1, block=True):
+        if self.worker is None and not self.done:
+            self.start()
+        field, stats, trace = self.field, self.stats, self.trace
+        received = False
+        while n > 0 and not self.done:
+            if self._event == len(self._events):
+                # without block at most one message, a worker that sends fast must not keep the
+                # caller here
+                if received and not block or not self.receive(block):
+                    break
+                received = True
+                continue
+            event = self._events[self._event]
+            self._event += 1
+            if event < SENSOR:
+                if not self._possible(event) or self._line == len(self._lines):
+                    self._crash()
+                    break
+                apply(field, event)
+                self.steps += 1
+                n -= 1
+                if stats is not None:
+                    stats.counts[ACTIONS[event]] += 1
+                if trace is not None:
+                    trace.record(event, self._lines[self._line])
+                self._line += 1
+            elif event < SENSOR + 2*len(SENSORS):
+                self.sensor_calls += 1
+                if stats is not None:
+                    stats.counts[SENSORS[(event - SENSOR) // 2]] += 1
+                if trace is not None:
+                    trace.sense(event)
+            else:
+                self._crash()
+        return not self.done
+
+    def _possible(self, event):
+        # the worker is not trusted to keep Niki inside the field and to the step limit
+        if self.max_steps is not None and self.steps >= self.max_steps:
+            return False
+        field = self.field
+        i = field.ny*field.size_x + field.nx
+        if event == VOR:
+            return field.free[i] >> field.direction & 1
+        if event == NIMM_AUF:
+            return field.discs[i] > 0 and field.vorrat < 99
+        if event == GIB_AB:
+            return field.vorrat > 0 and field.discs[i] < 9
+        return True
+
+    def run(self):
+        while self.advance(1024):
+            pass
+
+    def abort(self):
+        if not self.done:
+            if self.worker is not None:
+                self.pool.replace(self.worker)
+            self._stop(self._result('niki'))
+
+    def _crash(self, timeout=False):
+        end = self.pool.replace(self.worker)
+        if timeout:
+            self._stop(self._result('limit', 'time'))
+        else:
+            self._stop(self._result('crash', end))
+
+    def _result(self, error, error_name=None, error_line=None):
+        # result as grade() gives it, steps, sensor calls and state are those of the replayed events
+        if error and self.code is not None:
+            self.field.zustand = False
+        result = {
+            'error': error,
+            'error_line': error_line,
+            'error_name': error_name,
+            'steps': self.steps,
+            'sensor_calls': self.sensor_calls,
+            'time': time.perf_counter() - self._started if self._started is not None else 0.,
+            'state': field_state(self.field),
+        }
+        if self.stats is not None:
+            result['stats'] = self.stats.as_dict()
+        return result
+
+    def _stop(self, result):
+        self.done = True
+        self.result = result
+        self.error = result['error']
+        self.error_line = result.get('error_line')
+        self.error_name = result.get('error_name')
+        if self.trace is not None:
+            self.trace.error = self.error is not None
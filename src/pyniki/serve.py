@@ -0,0 +1,255 @@
+import argparse
+import asyncio
+import base64
+import json
+import math
+import os
+import signal
+import socket
+import sys
+import time
+
+from pyniki.archive import EXTENSION
+from pyniki.cache import code_cache
+from pyniki.client import SOCKET
+from pyniki.field import MAGIC, Field, load_field
+from pyniki.grade import _archive
+from pyniki.sandbox import WorkerPool
+
+# Jobs from all connections wait in one bounded queue for a worker of the pool. When it is
+# full a connection is not read any further, and a connection has at most queue_size jobs
+# whose results it has not read yet, so a client that stops reading only stops itself.
+
+LIMITS = {'max_steps', 'max_sensors', 'max_time', 'fast', 'stats'}
+_MAX_LINE = 64 * 2**20
+
+
+class RequestError(Exception):
+    pass
+
+
+def _field(message):
+    if 'field_data' in message:
+        try:
+            data = base64.b64decode(message['field_data'], validate=True)
+            # the old pickled format is only read from files, not from the socket
+            if data[:4] != MAGIC:
+                raise ValueError('kein Feld im NIKI-Format')
+            return Field.from_bytes(data)
+        except Exception as e:
+            raise RequestError(f'Feld: {e}')
+    ref = message.get('field')
+    if not isinstance(ref, str):
+        raise RequestError('kein Feld angegeben')
+    path, _, name = ref.rpartition(':')
+    try:
+        if path.endswith(EXTENSION):
+            archive = _archive(path)
+            if name not in archive:
+                archive.refresh()  # appended since the server opened the archive
+            return archive[name]
+        return load_field(ref)
+    except KeyError:
+        raise RequestError(f'Feld {name} nicht in {path}')
+    except Exception as e:
+        raise RequestError(f'Feld {ref}: {e}')
+
+
+def _job(message):
+    program = message.get('program')
+    if not isinstance(program, str):
+        raise RequestError('kein Programm angegeben')
+    limits = message.get('limits', {})
+    if not isinstance(limits, dict) or not limits.keys() <= LIMITS:
+        raise RequestError(f'unbekannte Grenze, erlaubt sind {", ".join(sorted(LIMITS))}')
+    for name, value in limits.items():
+        if name in ('fast', 'stats'):
+            valid = isinstance(value, bool)
+        else:
+            valid = value is None or isinstance(value, (int, float)) and not isinstance(value, bool) and value >= 0
+        if not valid:
+            raise RequestError(f'ungültiger Wert für {name}')
+    if limits.get('fast') and limits.get('stats'):
+        raise RequestError('fast und stats können nicht zusammen verwendet werden')
+    return program, _field(message), limits
+
+
+class Connection:
+
+    def __init__(self, reader, writer, queue_size):
+        self.reader, self.writer = reader, writer
+        self.unread = asyncio.Semaphore(queue_size)  # jobs whose result the client has not read
+        self.results = asyncio.Queue()
+        self.closed = False
+
+    def send(self, message):
+        self.results.put_nowait(message)
+
+    async def write_results(self):
+        while (message := await self.results.get()) is not None:
+            if not self.closed:
+                self.writer.write(json.dumps(message).encode() + b'\n')
+                try:
+                    await self.writer.drain()
+                except ConnectionError:
+                    self.closed = True
+            if 'status' not in message:
+                self.unread.release()
+
+
+class Server:
+
+    def __init__(self, pool, queue_size):
+        self.pool = pool
+        self.queue_size = queue_size
+        self.queue = asyncio.Queue(queue_size)
+        self.running = 0
+        self.done = 0
+        self.connections = 0
+        self.started = time.monotonic()
+
+    def status(self):
+        return {
+            'queued': self.queue.qsize(),
+            'queue_size': self.queue_size,
+            'running': self.running,
+            'workers': self.pool.size,
+            'done': self.done,
+            'connections': self.connections,
+            'uptime': time.monotonic() - self.started,
+        }
+
+    async def handle(self, reader, writer):
+        connection = Connection(reader, writer, self.queue_size)
+        writing = asyncio.ensure_future(connection.write_results())
+        self.connections += 1
+        try:
+            while line := await reader.readline():
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    message = None
+                if isinstance(message, dict) and message.get('status'):
+                    connection.send({'status': self.status()})
+                    continue
+                await connection.unread.acquire()
+                try:
+                    if not isinstance(message, dict):
+                        message = {}
+                        raise RequestError('keine Anfrage')
+                    job = _job(message)
+                except RequestError as e:
+                    connection.send({'id': message.get('id'), 'error': 'request', 'error_name': str(e)})
+                    continue
+                await self.queue.put((connection, message.get('id'), job))
+        except (ConnectionError, ValueError):  # ValueError: line too long
+            pass
+        finally:
+            self.connections -= 1
+            # results of the jobs already queued are still sent
+            for _ in range(self.queue_size):
+                await connection.unread.acquire()
+            connection.results.put_nowait(None)
+            await writing
+            connection.closed = True
+            writer.close()
+
+    async def dispatch(self):
+        while True:
+            connection, job_id, (program, field, limits) = await self.queue.get()
+            if connection.closed:
+                connection.unread.release()
+                continue
+            self.running += 1
+            try:
+                result = await self.grade(program, field, limits)
+            except Exception as e:
+                # whatever went wrong with one job, the dispatcher serves the next one and the
+                # connection gets its result
+                result = {'error': 'exception', 'error_name': type(e).__name__}
+            finally:
+                self.running -= 1
+            self.done += 1
+            connection.send(dict(id=job_id, **result))
+
+    async def grade(self, program, field, limits):
+        loop = asyncio.get_running_loop()
+        run = self.pool.start(program, field, limits)
+        try:
+            while not run.done:
+                fd = run.fileno()
+                ready = loop.create_future()
+                loop.add_reader(fd, lambda: ready.done() or ready.set_result(None))
+                try:
+                    await asyncio.wait_for(ready, max(0, run.deadline - time.monotonic()))
+                except asyncio.TimeoutError:
+                    pass
+                finally:
+                    loop.remove_reader(fd)
+                run.advance(math.inf, block=False)  # also ends the run once the deadline has passed
+        except BaseException:
+            run.abort()  # replaces the worker, it may be in the middle of the run
+            raise
+        return run.result
+
+
+async def serve(path, pool, queue_size):
+    server = Server(pool, queue_size)
+    if os.path.exists(path):
+        # a socket left over from a server that did not stop cleanly
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+        except ConnectionRefusedError:
+            os.unlink(path)
+        else:
+            raise OSError(f'{path}: Server läuft bereits')
+        finally:
+            probe.close()
+    old_umask = os.umask(0o077)  # only this user may send jobs
+    try:
+        unix_server = await asyncio.start_unix_server(server.handle, path, limit=_MAX_LINE)
+    finally:
+        os.umask(old_umask)
+    dispatchers = [asyncio.ensure_future(server.dispatch()) for _ in range(pool.size)]
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+    try:
+        async with unix_server:
+            await stop.wait()
+    finally:
+        for dispatcher in dispatchers:
+            dispatcher.cancel()
+        os.unlink(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='pyniki serve',
+        description='Roboterprogramme über einen Unix-Socket annehmen und in einer Sandbox ausführen.'
+    )
+    parser.add_argument('-s', '--socket', default=SOCKET, metavar='PFAD', help=f'Socket (Standard: {SOCKET})')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help='Anzahl der Prozesse, die Programme ausführen (Standard: Anzahl der CPU-Kerne)')
+    parser.add_argument('--queue', type=int, default=100, metavar='N',
+                        help='höchstens N wartende Aufträge, dann werden keine weiteren angenommen (Standard: 100)')
+    parser.add_argument('--cache', metavar='VERZEICHNIS',
+                        help='übersetzte Programme in diesem Verzeichnis zwischenspeichern')
+    parser.add_argument('--max-cpu', type=float, metavar='SEKUNDEN',
+                        help='CPU-Zeit je Lauf (Standard: 10)')
+    parser.add_argument('--max-memory', type=int, metavar='MiB',
+                        help='zusätzlicher Speicher je Prozess (Standard: 512)')
+    args = parser.parse_args(argv)
+    code_cache.path = args.cache
+    limits = {}
+    if args.max_cpu is not None:
+        limits['cpu'] = args.max_cpu
+    if args.max_memory is not None:
+        limits['memory'] = args.max_memory * 2**20
+    os.makedirs(os.path.dirname(os.path.abspath(args.socket)), exist_ok=True)
+    with WorkerPool(args.jobs, **limits) as pool:
+        print(f'pyniki serve: {args.socket}, {args.jobs} Prozesse', file=sys.stderr)
+        asyncio.run(serve(args.socket, pool, args.queue))
+    return 0
@@ -1,10 +1,15 @@
-import copy
+import asyncio
 import curses
 import sys
 import time
 import traceback
 
+from pyniki.cache import code_cache
+from pyniki.compiler import prelude
 from pyniki.curses import scr
+from pyniki.debug import Debugger, Recorder
+from pyniki.stats import Stats
+from pyniki.trace import event_name
 from pyniki.ui import draw_frame, print_first_line, print_highlight, print_last_line
 
 
@@ -12,143 +17,437 @@ class NikiError(Exception):
     pass
 
 
-_field = None
-
-
-def wait():
-    global speed
-    _field.draw()
-    if speed > 0:
-        scr.nodelay(True)
-    while (key:=scr.getch()) > -1:
-        if key == ord('\n') and speed == 0:
-            break
-        if key == ord('+'):
-            if speed == 0:
-                scr.nodelay(True)
-            if speed < 9:
-                speed += 1
-        elif key == ord('-'):
-            if speed == 1:
-                scr.nodelay(False)
-            if speed > 0:
-                speed -= 1
-        elif key == ord('0'):
-            scr.nodelay(False)
-            speed = 0
-        elif key == 27:
-            raise NikiError
-        run_print_first_line()
-    scr.nodelay(False)
-    if speed > 0:
-        time.sleep(0.1 + (9-speed)*0.2)
-
-
-def is_free(direction):
-    y, x = _field.pos
-    if direction == 0:
-        return not _field.v_walls[y][x+1]
-    elif direction == 1:
-        return not _field.h_walls[y+1][x]
-    elif direction == 2:
-        return not _field.v_walls[y][x]
-    else:
-        return not _field.h_walls[y][x]
-
-
-def vorne_frei():
-    return is_free(_field.direction)
-
-
-def links_frei():
-    return is_free((_field.direction + 1) % 4)
+class LimitError(BaseException):
+    # not an Exception, so `except Exception` in a program does not swallow it
 
+    def __init__(self, limit):
+        super().__init__(limit)
+        self.limit = limit
 
-def rechts_frei():
-    return is_free((_field.direction - 1) % 4)
 
+_field = None
+_stats = None
 
-def hat_vorrat():
-    return _field.vorrat > 0
-
-
-def platz_belegt():
-    discs = _field.get_discs(*_field.pos)
-    return discs > 0
-
-
-def nimm_auf():
-    if not platz_belegt():
-        raise NikiError
-    if _field.vorrat == 99:
-        raise NikiError
-    y, x = _field.pos
-    _field.set_discs(y, x, _field.get_discs(y, x) - 1)
-    _field.vorrat += 1
-    wait()
-
+# speed above 9: no sleeping, at most turbo_fps frames per second or, if turbo_steps is set,
+# one frame every turbo_steps steps
+TURBO = 10
+turbo_fps = 25
+turbo_steps = None
 
-def gib_ab():
-    if not hat_vorrat():
-        raise NikiError
-    y, x = _field.pos
-    discs = _field.get_discs(*_field.pos)
-    if discs == 9:
-        raise NikiError
-    _field.set_discs(y, x, discs + 1)
-    _field.vorrat -= 1
-    wait()
+# WorkerPool of pyniki.sandbox, if set programs run in its workers instead of in this process
+pool = None
 
 
-def vor():
-    if not vorne_frei():
-        raise NikiError()
-    y, x = _field.pos
-    if _field.direction == 0:
-        _field.pos = [y, x+1]
-    elif _field.direction == 1:
-        _field.pos = [y+1, x]
-    elif _field.direction == 2:
-        _field.pos = [y, x-1]
-    else:
-        _field.pos = [y-1, x]
-    wait()
+def _draw():
+    start = time.perf_counter()
+    _field.draw()
+    _stats.redraws += 1
+    _stats.draw_time += time.perf_counter() - start
 
 
-def drehe_links():
-    _field.direction = (_field.direction + 1) % 4
-    wait()
+async def _animate(sim):
+    # runs the Stepper sim frame by frame; keys are read as soon as they arrive, a speed change
+    # or ESC ends the current pause at once
+    global speed
+    wakeup = asyncio.Event()
+    single_steps = 0  # Enter pressed at speed 0
+
+    def read_keys():
+        global speed
+        nonlocal single_steps
+        while (key := scr.getch()) > -1:
+            if key == ord('\n') and speed == 0:
+                single_steps += 1
+            elif key == ord('+'):
+                speed = min(speed + 1, TURBO)
+            elif key == ord('-'):
+                speed = max(speed - 1, 0)
+            elif key == ord('0'):
+                speed = 0
+            elif key == 27:
+                try:
+                    sim.abort()
+                except Exception as e:
+                    failed(e)
+            else:
+                continue
+            run_print_first_line()
+            wakeup.set()
+
+    def failed(e):
+        # whatever a run raises ends it and is shown like an exception of the program
+        sim.done = True
+        sim._finish(e)
+
+    async def advance(n=1):
+        try:
+            return await advance_sim(n)
+        except Exception as e:
+            failed(e)
+            return False
+
+    async def advance_sim(n):
+        # a run in a sandbox worker must not block the loop while it waits for the worker, ESC
+        # would not be read
+        if pool is None:
+            return sim.advance(n)
+        steps = sim.steps + n
+        while sim.advance(steps - sim.steps, block=False) and sim.steps < steps:
+            fd = sim.fileno()
+            ready = loop.create_future()
+            loop.add_reader(fd, lambda: ready.done() or ready.set_result(None))
+            woken = asyncio.ensure_future(wakeup.wait())
+            try:
+                await asyncio.wait([ready, woken], timeout=max(0, sim.deadline - time.monotonic()),
+                                   return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                woken.cancel()
+                loop.remove_reader(fd)
+            wakeup.clear()
+        return not sim.done
+
+    loop = asyncio.get_running_loop()
+    loop.add_reader(sys.stdin.fileno(), read_keys)
+    scr.nodelay(True)
+    try:
+        while not sim.done:
+            wakeup.clear()
+            if speed == TURBO:
+                if turbo_steps:
+                    await advance(turbo_steps)
+                else:
+                    deadline = time.perf_counter() + 1 / turbo_fps
+                    while await advance(64) and time.perf_counter() < deadline:
+                        pass
+                _draw()
+                await asyncio.sleep(0)  # let read_keys run
+            elif speed == 0:
+                if not single_steps:
+                    await wakeup.wait()
+                    continue
+                single_steps -= 1
+                await advance()
+                _draw()
+            else:
+                sleep_start = time.perf_counter()
+                try:
+                    await asyncio.wait_for(wakeup.wait(), delay(speed))
+                    continue
+                except asyncio.TimeoutError:
+                    pass
+                finally:
+                    _stats.sleep_time += time.perf_counter() - sleep_start
+                await advance()
+                _draw()
+    finally:
+        loop.remove_reader(sys.stdin.fileno())
+        scr.nodelay(False)
+
+
+def speed_name(speed):
+    return 'T' if speed == TURBO else str(speed)
+
+
+def delay(speed):
+    return 0.1 + (9-speed)*0.2
+
+
+PRIMITIVES = ['vor', 'drehe_links', 'nimm_auf', 'gib_ab', 'vorne_frei',
+              'links_frei', 'rechts_frei', 'hat_vorrat', 'platz_belegt']
+
+
+# how many primitive or sensor calls may pass between two checks of the wall-clock limit
+_TIME_CHECK_INTERVAL = 128
+
+
+class Simulator:
+
+    mode = 'exec'
+
+    def __init__(self, program, field, wait=None, max_steps=None, max_sensors=None, max_time=None,
+                 trace=None, stats=None, fast=False):
+        if fast and (wait is not None or trace is not None or stats is not None):
+            raise ValueError('fast mode runs without wait hook, trace and stats')
+        self.program = program
+        self.field = field.copy()
+        self.wait = wait if wait is not None else lambda: None
+        self.trace = trace
+        self.stats = stats
+        if fast:
+            self.mode = 'fast'
+        self.max_steps, self.max_sensors, self.max_time = max_steps, max_sensors, max_time
+        self.code = None
+        self.steps = 0
+        self.sensor_calls = 0
+        self.error = None
+        self.error_line = None
+        self.error_name = None
+        self._deadline = None
+        self._limit = None  # once a limit is hit, every further primitive call raises again
+        self._set_checks()
+
+    def _set_checks(self):
+        # the primitives only compare a counter against these thresholds; everything else
+        # happens in _check_limits once a threshold is reached
+        step_check = self.max_steps if self.max_steps is not None else float('inf')
+        sensor_check = self.max_sensors if self.max_sensors is not None else float('inf')
+        if self._deadline is not None:
+            step_check = min(step_check, self.steps + _TIME_CHECK_INTERVAL)
+            sensor_check = min(sensor_check, self.sensor_calls + _TIME_CHECK_INTERVAL)
+        self._step_check, self._sensor_check = step_check, sensor_check
+
+    def _check_limits(self):
+        if self._limit is None:
+            if self.max_steps is not None and self.steps >= self.max_steps:
+                self._limit = 'steps'
+            elif self.max_sensors is not None and self.sensor_calls > self.max_sensors:
+                self._limit = 'sensors'
+            elif self._deadline is not None and time.monotonic() > self._deadline:
+                self._limit = 'time'
+        if self._limit is not None:
+            raise LimitError(self._limit)
+        self._set_checks()
+
+    def is_free(self, direction):
+        field = self.field
+        return field.free[field.ny*field.size_x + field.nx] >> direction & 1 == 1
+
+    def vorne_frei(self):
+        self.sensor_calls += 1
+        if self.sensor_calls > self._sensor_check:
+            self._check_limits()
+        return self.is_free(self.field.direction)
+
+    def links_frei(self):
+        self.sensor_calls += 1
+        if self.sensor_calls > self._sensor_check:
+            self._check_limits()
+        return self.is_free((self.field.direction + 1) % 4)
+
+    def rechts_frei(self):
+        self.sensor_calls += 1
+        if self.sensor_calls > self._sensor_check:
+            self._check_limits()
+        return self.is_free((self.field.direction - 1) % 4)
+
+    def hat_vorrat(self):
+        self.sensor_calls += 1
+        if self.sensor_calls > self._sensor_check:
+            self._check_limits()
+        return self.field.vorrat > 0
+
+    def platz_belegt(self):
+        self.sensor_calls += 1
+        if self.sensor_calls > self._sensor_check:
+            self._check_limits()
+        discs = self.field.get_discs(*self.field.pos)
+        return discs > 0
+
+    def nimm_auf(self):
+        if self.steps >= self._step_check:
+            self._check_limits()
+        field = self.field
+        y, x = field.pos
+        discs = field.get_discs(y, x)
+        if discs == 0:
+            raise NikiError
+        if field.vorrat == 99:
+            raise NikiError
+        field.set_discs(y, x, discs - 1)
+        field.vorrat += 1
+        self.steps += 1
+        self.wait()
+
+    def gib_ab(self):
+        if self.steps >= self._step_check:
+            self._check_limits()
+        field = self.field
+        if field.vorrat == 0:
+            raise NikiError
+        y, x = field.pos
+        discs = field.get_discs(y, x)
+        if discs == 9:
+            raise NikiError
+        field.set_discs(y, x, discs + 1)
+        field.vorrat -= 1
+        self.steps += 1
+        self.wait()
+
+    def vor(self):
+        if self.steps >= self._step_check:
+            self._check_limits()
+        field = self.field
+        if not self.is_free(field.direction):
+            raise NikiError()
+        y, x = field.pos
+        if field.direction == 0:
+            field.pos = [y, x+1]
+        elif field.direction == 1:
+            field.pos = [y+1, x]
+        elif field.direction == 2:
+            field.pos = [y, x-1]
+        else:
+            field.pos = [y-1, x]
+        self.steps += 1
+        self.wait()
+
+    def drehe_links(self):
+        if self.steps >= self._step_check:
+            self._check_limits()
+        field = self.field
+        field.direction = (field.direction + 1) % 4
+        self.steps += 1
+        self.wait()
+
+    def namespace(self):
+        namespace = {name: getattr(self, name) for name in PRIMITIVES}
+        if self.trace is not None:
+            namespace = self.trace.wrap(namespace)
+        if self.stats is not None:
+            namespace = self.stats.wrap(namespace)
+        return namespace
+
+    def _exec_fast(self):
+        # see pyniki.compiler for the meaning of the _niki_ globals
+        field = self.field
+        ns = {
+            '_niki_p': field.ny*field.size_x + field.nx,
+            '_niki_d': field.direction,
+            '_niki_v': field.vorrat,
+            '_niki_discs': field.discs,
+            '_niki_free': field.free,
+            '_niki_delta': (1, field.size_x, -1, -field.size_x),
+            '_niki_steps': self.steps,
+            '_niki_sensors': self.sensor_calls,
+            '_niki_step_check': self._step_check,
+            '_niki_sensor_check': self._sensor_check,
+            '_niki_error': NikiError,
+        }
+
+        def check():
+            self.steps, self.sensor_calls = ns['_niki_steps'], ns['_niki_sensors']
+            self._check_limits()
+            ns['_niki_step_check'], ns['_niki_sensor_check'] = self._step_check, self._sensor_check
+
+        ns['_niki_check'] = check
+        exec(prelude, ns)
+        try:
+            exec(self.code, ns)
+        finally:
+            self.steps, self.sensor_calls = ns['_niki_steps'], ns['_niki_sensors']
+            field.pos = divmod(ns['_niki_p'], field.size_x)
+            field.direction = ns['_niki_d']
+            field.vorrat = ns['_niki_v']
+
+    def compile(self):
+        if self.code is None and self.error is None:
+            try:
+                # the plain compile gives the syntax errors the program would get with exec
+                code = code_cache.compile(self.program)
+                if self.mode != 'exec':
+                    code = code_cache.compile(self.program, self.mode)
+                self.code = code
+            except IndentationError as e:
+                self.error, self.error_line = 'indentation', e.lineno
+            except SyntaxError as e:
+                self.error, self.error_line = 'syntax', e.lineno
+            except (RecursionError, MemoryError, ValueError):
+                # nested too deeply for the compiler, or null bytes before Python 3.12
+                self.error, self.error_line = 'syntax', None
+        return self.code is not None
+
+    def program_line(self, tb):
+        lines = [frame.lineno for frame in traceback.extract_tb(tb)
+                 if frame.filename == self.code.co_filename]
+        return lines[-1] if lines else None
+
+    def _start(self):
+        if not self.compile():
+            return False
+        self.field.zustand = True
+        if self.max_time is not None:
+            self._deadline = time.monotonic() + self.max_time
+            self._set_checks()
+        if self.trace is not None:
+            self.trace.start(self.field)
+        return True
+
+    def _finish(self, e=None):
+        if isinstance(e, LimitError):
+            self.error = 'limit'
+            self.error_name = e.limit
+            self.error_line = self.program_line(e.__traceback__)
+        elif isinstance(e, NikiError):
+            self.error = 'niki'
+        elif isinstance(e, NameError):
+            self.error = 'name'
+            self.error_line = traceback.extract_tb(e.__traceback__)[-1].lineno
+            try:
+                self.error_name = e.name
+            except AttributeError:  # Python < 3.10
+                # from https://stackoverflow.com/a/44731654
+                import re
+                self.error_name = re.search("'(?P<name>.+?)'", e.args[0]).group('name')
+        elif e is not None:
+            self.error = 'exception'
+            self.error_name = type(e).__name__
+            self.error_line = self.program_line(e.__traceback__) if self.code is not None else None
+        if self.error:
+            self.field.zustand = False
+        if self.trace is not None:
+            self.trace.error = self.error is not None
+
+    def run(self):
+        if not self._start():
+            return
+        try:
+            self.wait()
+            if self.mode == 'fast':
+                self._exec_fast()
+            else:
+                exec(self.code, self.namespace())
+        except (KeyboardInterrupt, LimitError, NikiError, NameError) as e:
+            self._finish(e)
+        else:
+            self._finish()
 
 
 def run_print_first_line():
     print_first_line(
-        f'@ESC + - 0@                                                    Geschwindigkeit: {speed}'
+        f'@ESC + - 0@                                                    Geschwindigkeit: {speed_name(speed)}'
     )
 
 
 def run_program(program, field):
+    from pyniki.stepper import Stepper
     global speed
     global _field
+    global _stats
 
-    _field = copy.deepcopy(field)
+    if pool is not None:
+        sim = pool.run(program, field, trace=Recorder(), stats=Stats(timing=True))
+    else:
+        sim = Stepper(program, field, trace=Recorder(), stats=Stats(timing=True))
+    _field, _stats = sim.field, sim.stats
+    _field.stats = sim.stats
 
-    try:
-        compile(program, 'None', 'exec')
-    except (IndentationError, SyntaxError) as e:
+    if not sim.compile():
         draw_frame(5, 60, 16, 10)
         scr.move(18, 12)
-        if isinstance(e, IndentationError):
-            print_highlight(f'@FEHLER!@ Falsche Einrückung in Zeile {e.lineno}')
+        if sim.error == 'indentation':
+            print_highlight(f'@FEHLER!@ Falsche Einrückung in Zeile {sim.error_line}')
+        elif sim.error_line is None:
+            print_highlight('@FEHLER!@ Programm kann nicht übersetzt werden')
         else:
-            print_highlight(f'@FEHLER!@ Syntaxfehler in Zeile {e.lineno}')
+            print_highlight(f'@FEHLER!@ Syntaxfehler in Zeile {sim.error_line}')
         key = scr.getch()
         scr.clear()
         return
     scr.clear()
     _field.zustand = True
-    _field.draw()
+    _field.draw(full=True)
 
-    print_last_line('Geschwindigkeit eingeben (0..9)')
+    print_last_line('Geschwindigkeit eingeben (0..9, T für Turbo)')
     print_first_line(f'{"Geschwindigkeit:  ":>79}')
     scr.move(0, 78)
     curses.curs_set(1)
@@ -157,43 +456,139 @@ def run_program(program, field):
         if key in [ord(str(i)) for i in range(0, 10)]:
             speed = int(chr(key))
             break
+        if key == ord('t'):
+            speed = TURBO
+            break
     curses.curs_set(0)
     print_last_line('')
 
     run_print_first_line()
-    error = False
     try:
-        wait()
-        exec(program, {k: v for k, v in globals().items()
-                       if k in ['vor', 'drehe_links', 'nimm_auf', 'gib_ab', 'vorne_frei',
-                                'links_frei', 'rechts_frei', 'hat_vorrat', 'platz_belegt']})
+        asyncio.run(_animate(sim))
     except KeyboardInterrupt:
-        pass
-    except NikiError:
-        error = True
-    except NameError as e:
-        line = traceback.extract_tb(sys.exc_info()[2])[-1].lineno
-        try:
-            name = e.name
-        except AttributeError:  # Python < 3.10
-            # from https://stackoverflow.com/a/44731654
-            import re
-            name = re.search("'(?P<name>.+?)'", e.args[0]).group('name')
-        print_first_line(f'@FEHLER!@ Unbekannter Name "{name}" in Zeile {line}')
-        error = True
-    if error:
-        _field.zustand = False
-        _field.draw()
-        print_last_line(
-            'Niki hat sich abgeschaltet                                  <Leertaste drücken>'
-        )
-    else:
-        print_last_line(
-            'Programm beendet                                            <Leertaste drücken>'
-        )
+        sim.abort()
+    _field.draw()
 
     while True:
+        if sim.error == 'name':
+            print_first_line(f'@FEHLER!@ Unbekannter Name "{sim.error_name}" in Zeile {sim.error_line}')
+        elif sim.error == 'exception':
+            where = f' in Zeile {sim.error_line}' if sim.error_line is not None else ''
+            print_first_line(f'@FEHLER!@ {sim.error_name}{where}')
+        elif sim.error == 'limit':
+            print_first_line(f'@FEHLER!@ Grenze überschritten: {sim.error_name}')
+        elif sim.error == 'crash':
+            print_first_line(f'@FEHLER!@ Programm abgestürzt ({sim.error_name or "unbekannt"})')
+        if sim.error:
+            print_last_line(
+                'Niki hat sich abgeschaltet        @W@iederholung  @S@tatistik  <Leertaste drücken>'
+            )
+        else:
+            print_last_line(
+                'Programm beendet                  @W@iederholung  @S@tatistik  <Leertaste drücken>'
+            )
         key = scr.getch()
         if key == ord(' '):
             break
+        elif key == ord('w'):
+            replay(Debugger(program, field, sim.trace, sim.error_line, simulator=pool and pool.run))
+            scr.clear()
+            run_print_first_line()
+            _field.draw(full=True)
+        elif key == ord('s'):
+            show_stats(sim.stats)
+            scr.clear()
+            run_print_first_line()
+            _field.draw(full=True)
     scr.clear()
+
+
+def show_stats(stats):
+    draw_frame(17, 50, 3, 15)
+    scr.addstr(4, 17, f'{"":14}{"Anzahl":>12}{"Zeit (ms)":>18}')
+    for i, (name, count) in enumerate(stats.counts.items()):
+        scr.addstr(6 + i, 17, f'{name:14}{count:12}{stats.times[name] * 1000:18.3f}')
+    scr.addstr(16, 17, f'{"Zeichnen":14}{stats.redraws:12}{stats.draw_time * 1000:18.3f}')
+    scr.addstr(17, 17, f'{"Warten":14}{"":12}{stats.sleep_time * 1000:18.3f}')
+    print_last_line(f'{"<Leertaste drücken>":>79}')
+    while scr.getch() != ord(' '):
+        pass
+
+
+def replay(player):
+    scr.clear()
+    asyncio.run(_replay(player))
+    scr.clear()
+
+
+async def _replay(player):
+    # plays the steps at the chosen speed, a key ends the current pause at once
+    speed = 0
+    keys = asyncio.Event()
+    keys.set()  # curses may have keys read already
+    loop = asyncio.get_running_loop()
+    loop.add_reader(sys.stdin.fileno(), keys.set)
+    scr.nodelay(True)
+    try:
+        while True:
+            player.field.draw()
+            status = f'Schritt {player.step}/{player.steps}   Geschwindigkeit: {speed}'
+            print_first_line(f'@ESC + - 0 ← → Pos1 Ende S@prung @F@ehler{status:>42}')
+            line = player.line
+            text = f'Zeile {line}: {player.source(line)}' if line is not None else ''
+            if answers := player.answers:
+                text = f'{text}   {", ".join(event_name(event) for event in answers)}'
+            print_last_line(text[:79])
+            if speed > 0:
+                try:
+                    await asyncio.wait_for(keys.wait(), delay(speed))
+                except asyncio.TimeoutError:
+                    if not player.forward():
+                        speed = 0
+                    continue
+            else:
+                await keys.wait()
+            keys.clear()
+            while (key := scr.getch()) > -1:
+                if key == 27:
+                    return
+                elif key == ord('+'):
+                    speed = min(speed + 1, 9)
+                elif key == ord('-'):
+                    speed = max(speed - 1, 0)
+                elif key == ord('0'):
+                    speed = 0
+                elif key == curses.KEY_RIGHT:
+                    speed = 0
+                    player.forward()
+                elif key == curses.KEY_LEFT:
+                    speed = 0
+                    player.backward()
+                elif key == curses.KEY_HOME:
+                    player.seek(0)
+                elif key == curses.KEY_END:
+                    player.seek(player.steps)
+                elif key == ord('f'):
+                    if player.error:
+                        speed = 0
+                        player.seek(player.steps)
+                elif key == ord('s'):
+                    speed = 0
+                    print_last_line('Schritt eingeben: ')
+                    curses.curs_set(1)
+                    scr.nodelay(False)
+                    digits = ''
+                    while (key := scr.getch()) != ord('\n'):
+                        if key in [ord(str(i)) for i in range(0, 10)] and len(digits) < 9:
+                            digits += chr(key)
+                            scr.addstr(chr(key))
+                        elif key == 27:
+                            digits = ''
+                            break
+                    scr.nodelay(True)
+                    curses.curs_set(0)
+                    if digits:
+                        player.seek(int(digits))
+    finally:
+        loop.remove_reader(sys.stdin.fileno())
+        scr.nodelay(False)
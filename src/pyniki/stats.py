@@ -0,0 +1,55 @@
+import time
+
+from pyniki.trace import ACTIONS, SENSORS
+
+
+class Stats:
+
+    def __init__(self, timing=False):
+        self.timing = timing
+        self.counts = dict.fromkeys(ACTIONS + SENSORS, 0)
+        self.times = dict.fromkeys(ACTIONS + SENSORS, 0.)
+        self.redraws = 0
+        self.draw_time = 0.
+        self.sleep_time = 0.
+
+    @property
+    def actions(self):
+        return sum(self.counts[name] for name in ACTIONS)
+
+    @property
+    def sensors(self):
+        return sum(self.counts[name] for name in SENSORS)
+
+    def wrap(self, namespace):
+        counts, times = self.counts, self.times
+
+        def counted(f, name):
+            def primitive():
+                counts[name] += 1
+                return f()
+            return primitive
+
+        def timed(f, name):
+            def primitive():
+                counts[name] += 1
+                start = time.perf_counter()
+                try:
+                    return f()
+                finally:
+                    times[name] += time.perf_counter() - start
+            return primitive
+
+        wrap = timed if self.timing else counted
+        namespace = dict(namespace)
+        for name in ACTIONS + SENSORS:
+            namespace[name] = wrap(namespace[name], name)
+        return namespace
+
+    def as_dict(self):
+        stats = {'counts': self.counts}
+        if self.timing:
+            stats['times'] = self.times
+        if self.redraws:
+            stats.update(redraws=self.redraws, draw_time=self.draw_time, sleep_time=self.sleep_time)
+        return stats
@@ -0,0 +1,131 @@
+import functools
+import sys
+
+from pyniki.sim import LimitError, NikiError, Simulator
+from pyniki.trace import ACTIONS
+
+STEP = object()
+
+
+def _niki_function(generator):
+    # a function of the program, turned into a generator by compile_stepper; called directly
+    # it runs to completion like the original
+    @functools.wraps(generator)
+    def function(*args, **kwargs):
+        steps = generator(*args, **kwargs)
+        try:
+            while True:
+                next(steps)
+        except StopIteration as e:
+            return e.value
+
+    function._niki_generator = generator
+    generator._niki_function = function
+    return function
+
+
+def _niki_call(f, /, *args, **kwargs):
+    generator = getattr(f, '_niki_generator', None)
+    # functools.wraps in a decorator of the program copies _niki_generator, the decorator must run
+    if generator is not None and getattr(generator, '_niki_function', None) is f:
+        return (yield from generator(*args, **kwargs))
+    result = f(*args, **kwargs)
+    if result is STEP:
+        yield
+        return None
+    return result
+
+
+def _niki_run(result):
+    return None if result is STEP else result
+
+
+class Stepper(Simulator):
+
+    mode = 'step'
+
+    def __init__(self, program, field, **kwargs):
+        super().__init__(program, field, **kwargs)
+        self._main = None
+        self.done = False
+
+    def namespace(self):
+        namespace = super().namespace()
+
+        def step(action):
+            def stepped():
+                action()
+                return STEP
+            return stepped
+
+        for name in ACTIONS:
+            namespace[name] = step(namespace[name])
+        namespace['_niki_call'] = _niki_call
+        namespace['_niki_run'] = _niki_run
+        namespace['_niki_function'] = _niki_function
+        namespace['_niki_import'] = lambda statement: exec(statement, namespace)
+        return namespace
+
+    def start(self):
+        if not self._start():
+            self.done = True
+            return False
+        namespace = self.namespace()
+        exec(self.code, namespace)
+        self._main = namespace['_niki_main']()
+        return True
+
+    def advance(self, n=1):
+        if self._main is None and not self.done:
+            self.start()
+        # every call of the program also has a frame of _niki_call, the program gets as deep as
+        # with the Simulator
+        limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(2 * limit)
+        try:
+            for _ in range(n):
+                if self.done:
+                    break
+                next(self._main)
+        except StopIteration:
+            self._stop()
+        except (KeyboardInterrupt, LimitError, NikiError, NameError) as e:
+            self._stop(e)
+        except (Exception, SystemExit) as e:  # reported as error 'exception', as by grade()
+            self._stop(e)
+        finally:
+            sys.setrecursionlimit(limit)
+        return not self.done
+
+    def abort(self):
+        if self.done:
+            return
+        main, self._main = self._main, None
+        # a program that catches GeneratorExit and calls the next action makes close() raise
+        # RuntimeError and stays suspended, Python closes it once more when it is freed; neither
+        # may end up on the screen
+        hook = sys.unraisablehook
+        sys.unraisablehook = lambda unraisable: None
+        try:
+            if main is not None:
+                main.close()
+        except Exception:
+            pass
+        finally:
+            del main
+            sys.unraisablehook = hook
+            self._stop(NikiError())
+
+    def _stop(self, e=None):
+        self.done = True
+        self._finish(e)
+
+    def run(self):
+        while self.advance(1024):
+            pass
+
+
+def interleave(steppers, n=100):
+    running = list(steppers)
+    while running:
+        running = [s for s in running if s.advance(n)]
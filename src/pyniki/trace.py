@@ -0,0 +1,56 @@
+import sys
+
+VOR, DREHE_LINKS, NIMM_AUF, GIB_AB = range(4)
+ACTIONS = ['vor', 'drehe_links', 'nimm_auf', 'gib_ab']
+SENSORS = ['vorne_frei', 'links_frei', 'rechts_frei', 'hat_vorrat', 'platz_belegt']
+# sensor i answering r is recorded as SENSOR + 2*i + r
+SENSOR = 4
+
+
+def event_name(event):
+    if event < SENSOR:
+        return ACTIONS[event]
+    return f'{SENSORS[(event - SENSOR) // 2]}() == {bool((event - SENSOR) % 2)}'
+
+
+def apply(field, event, backwards=False):
+    y, x = field.pos
+    if event == VOR:
+        d = field.direction if not backwards else (field.direction + 2) % 4
+        field.pos = [y, x+1] if d == 0 else [y+1, x] if d == 1 else [y, x-1] if d == 2 else [y-1, x]
+    elif event == DREHE_LINKS:
+        field.direction = (field.direction + (1 if not backwards else -1)) % 4
+    elif event in (NIMM_AUF, GIB_AB):
+        delta = 1 if (event == GIB_AB) != backwards else -1
+        field.set_discs(y, x, field.get_discs(y, x) + delta)
+        field.vorrat -= delta
+
+
+def wrap(namespace, trace):
+    # Wraps the primitives of a program namespace for a trace, the Recorder or the stream of a
+    # sandbox worker: actions call trace.record(event, line) once they succeeded, sensors
+    # trace.sense(event).
+    def action(f, event):
+        def recorded():
+            line = trace.line(sys._getframe(1))
+            try:
+                f()
+            except BaseException:
+                trace.error_line = line
+                raise
+            trace.record(event, line)
+        return recorded
+
+    def sensor(f, event):
+        def recorded():
+            r = f()
+            trace.sense(event + r)
+            return r
+        return recorded
+
+    namespace = dict(namespace)
+    for i, name in enumerate(ACTIONS):
+        namespace[name] = action(namespace[name], i)
+    for i, name in enumerate(SENSORS):
+        namespace[name] = sensor(namespace[name], SENSOR + 2*i)
+    return namespace
@@ -0,0 +1,97 @@
+import pytest
+
+from pyniki.field import Field
+from pyniki.sim import Simulator
+from pyniki.stepper import Stepper
+
+# programs whose functions are called by Python itself or that the Stepper has to rewrite
+PROGRAMS = {
+    'map': 'def go(x):\n    vor()\n    return x\nxs = list(map(go, [1, 2, 3]))\n',
+    'filter': 'def ok(x):\n    return vorne_frei()\nxs = list(filter(ok, range(3)))\n',
+    'sorted': 'def key(x):\n    drehe_links()\n    return -x\nxs = sorted([3, 1, 2], key=key)\n',
+    'decorator': ('def twice(f):\n    def g():\n        f()\n        f()\n    return g\n'
+                  '@twice\ndef step():\n    vor()\nstep()\n'),
+    'wraps': ('import functools\ndef log(f):\n    @functools.wraps(f)\n    def g(*args):\n'
+              '        drehe_links()\n        return f(*args)\n    return g\n'
+              '@log\ndef step(n):\n    for i in range(n):\n        vor()\nstep(2)\n'),
+    'import_star': 'from math import *\nfor i in range(int(sqrt(9))):\n    vor()\n',
+    'recursion': 'def f(n):\n    if n:\n        vor()\n        f(n - 1)\nf(4)\n',
+    'deep_recursion': 'def f(n):\n    drehe_links()\n    if n:\n        f(n - 1)\nf(600)\n',
+    'future': '"""Niki"""\nfrom __future__ import annotations\ndef f(x: Unknown):\n    vor()\nf(1)\n',
+    'keywords': 'def f(a, f=1, *, b=2):\n    for i in range(a + f + b):\n        drehe_links()\nf(1, f=2, b=0)\n',
+    'comprehension': 'def f():\n    vor()\n    return 1\nxs = [f() for _ in range(2)]\n',
+    'lambda': 'g = lambda: vor()\ng()\ng()\n',
+    'method': 'class A:\n    def m(self):\n        vor()\n        return self\nA().m().m()\n',
+    'generator': ('def gen():\n    for i in range(3):\n        vor()\n        yield i\n'
+                  'for x in gen():\n    drehe_links()\n'),
+    'niki_error': 'def f():\n    vor()\n    nimm_auf()\nf()\n',
+    'name_error': 'def f():\n    vor()\n    foo()\nf()\n',
+    'limit': 'while True:\n    drehe_links()\n',
+}
+
+# programs that bind the names of Niki functions themselves or call them where compile_fast()
+# cannot inline them
+FAST_PROGRAMS = dict(
+    PROGRAMS,
+    rebound='vor = drehe_links\nfor i in range(3):\n    vor()\n',
+    shadowed='def vor():\n    drehe_links()\n    drehe_links()\nvor()\nvor()\n',
+    parameter='def f(vorne_frei):\n    while vorne_frei():\n        vor()\nf(lambda: not links_frei())\n',
+    nested_lambda='def f():\n    g = lambda: vorne_frei() and vor()\n    g()\n    g()\nf()\n',
+    nested_comprehension=('def f():\n    return [drehe_links() for _ in range(3)]\nf()\n'
+                          'xs = {vorne_frei() for _ in "ab"}\n'),
+    class_body='class A:\n    vor()\n    x = [vorne_frei() for _ in range(2)]\n',
+)
+
+
+def result(sim):
+    field = sim.field
+    return (sim.error, sim.error_name, sim.steps, sim.sensor_calls, bytes(field.discs), field.pos,
+            field.direction, field.vorrat, field.zustand)
+
+
+@pytest.mark.parametrize('name', PROGRAMS)
+@pytest.mark.parametrize('n', [1, 7, 1000])
+def test_stepper_matches_simulator(name, n):
+    field = Field(10, 15, 1)
+    simulator = Simulator(PROGRAMS[name], field, max_steps=1000)
+    simulator.run()
+    stepper = Stepper(PROGRAMS[name], field, max_steps=1000)
+    while stepper.advance(n):
+        pass
+    assert result(stepper) == result(simulator)
+
+
+@pytest.mark.parametrize('name', FAST_PROGRAMS)
+def test_fast_matches_simulator(name):
+    field = Field(10, 15, 1)
+    simulator = Simulator(FAST_PROGRAMS[name], field, max_steps=1000)
+    simulator.run()
+    fast = Simulator(FAST_PROGRAMS[name], field, max_steps=1000, fast=True)
+    fast.run()
+    assert result(fast) == result(simulator)
+
+
+def test_stepper_suspends_after_every_action():
+    stepper = Stepper(PROGRAMS['recursion'], Field(10, 15, 1))
+    steps = []
+    while stepper.advance():
+        steps.append(stepper.steps)
+    assert steps == [1, 2, 3, 4]
+
+
+def test_stepper_reports_exceptions():
+    stepper = Stepper('vor()\nx = 1 / 0\n', Field(10, 15, 1))
+    stepper.run()
+    assert (stepper.error, stepper.error_name, stepper.error_line, stepper.steps) == \
+        ('exception', 'ZeroDivisionError', 2, 1)
+
+
+@pytest.mark.parametrize('program', [
+    'try:\n    while True:\n        drehe_links()\nfinally:\n    drehe_links()\n',
+    'while True:\n    try:\n        drehe_links()\n    except:\n        pass\n',
+])
+def test_abort_stops_programs_that_go_on(program):
+    stepper = Stepper(program, Field(10, 15, 1))
+    stepper.advance(5)
+    stepper.abort()
+    assert stepper.done and stepper.error == 'niki'